@@ -1,15 +1,55 @@
-from typing import List, Optional, Dict
+from typing import Callable, List, Optional, Dict
 from pydantic import BaseModel
-from langgraph.graph import StateGraph, START, END
 
 import argparse
+import functools
+import hashlib
+import json
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Import BAML-generated client and types
-from baml_client.sync_client import b  # BAML synchronous client
-from baml_client.types import Clarification, Plan, Critique, ResultItem, RankedResultItem, Answer, ContextItem
+from llm import call_llm, expected_latency, router  # BAML functions, routed to the fastest healthy client
+from baml_client.types import Clarification, Plan, Step, Critique, RankedResultItem, Answer, ContextItem, Source, Tool
 
 # Import tools
-from tools import web_search, get_current_price
+from tools import web_search, multi_search, get_current_price, local_docs, tool_available, find_coin_ids, coin_page_url, canonical_link, SEARCH_TIMEOUT, PRICE_TIMEOUT
+from planner import local_plan, planner_report, PLANNER_CONFIDENCE_THRESHOLD
+from ranking import IncrementalRanker, local_rank, tokenize
+from metrics import metrics
+from memory import MEMORY_MAX_AGE, MIN_HITS, research_memory
+from answer_cache import ANSWER_TTLS, DEFAULT_TTL, AnswerCache, default_answer_cache
+from results import ResultRecord, apply_ranking
+from scheduler import submit_in_context
+import search_backends
+
+# Question shapes that ask for a single current price and nothing else, e.g. "what is the price of BTC?",
+# "btc price today", "how much is one ethereum worth". The <coin> group is resolved against COIN_ID_MAP.
+PRICE_QUESTION_PATTERNS = [
+    re.compile(r"^(?:what(?:'s| is)|tell me|give me|show me|check|get)?\s*(?:the\s+)?(?:current\s+|latest\s+|live\s+|today'?s\s+)?(?:price|value)\s+(?:of\s+)?(?:one\s+|1\s+|a\s+)?(?P<coin>[a-z0-9]+)$"),
+    re.compile(r"^(?:what(?:'s| is)\s+)?(?:the\s+)?(?:current\s+|latest\s+|live\s+)?(?P<coin>[a-z0-9]+)\s+(?:price|value)$"),
+    re.compile(r"^how much is (?:one\s+|1\s+|a\s+)?(?P<coin>[a-z0-9]+)(?:\s+worth)?$"),
+    re.compile(r"^(?:what(?:'s| is)\s+)?(?P<coin>[a-z0-9]+)\s+trading at$"),
+]
+# Trailing qualifiers that do not change the meaning of a current-price question.
+PRICE_QUESTION_SUFFIX = re.compile(r"\s+(?:(?:right\s+)?now|today|currently|in\s+(?:usd|dollars|us\s+dollars))$")
+
+# Citation markers like [0], [12] in a cited answer
+CITATION_PATTERN = re.compile(r"\[(\d+)\]")
+
+class RefinementPolicy(BaseModel):
+    """When to critique and refine an answer.
+
+    The local pre-check skips the CritiqueAnswer call when the answer is well cited from enough
+    high-scoring sources; `max_attempts` bounds the number of answer attempts.
+    """
+    max_attempts: int = 2
+    precheck: bool = True
+    min_citation_coverage: float = 0.8  # fraction of sentences carrying a citation
+    min_sources: int = 2  # distinct sources cited
+    min_relevance: float = 7.0  # mean relevance_score of the cited results
 
 # Define the shared state for the agent's workflow
 class AgentState(BaseModel):
@@ -18,166 +58,818 @@ class AgentState(BaseModel):
     clarification_answer: Optional[str] = None
     subqueries: List[str] = []
     plan: Optional[Plan] = None
-    raw_results: List[Dict[str, Optional[str]]] = []
-    relevant_results: List[Dict[str, Optional[str]]] = []
+    # Gathered results; emptied once they are ranked, only relevant_results is needed after that
+    raw_results: List[ResultRecord] = []
+    relevant_results: List[ResultRecord] = []  # the ranked results (best first), carrying their relevance_score
     answer: Optional[Answer] = None
     critique: Optional[Critique] = None
     attempt_count: int = 1  # number of answer attempts made (for loop control)
+    refinement: RefinementPolicy = RefinementPolicy()
+    answered_by_fast_path: bool = False  # True when the question was answered by the deterministic price fast path
+    local_planner: bool = True  # try the rule-based planner before calling PlanSteps
+    interactive: bool = True  # whether ask_user_node may prompt for clarification on stdin
+    deadline: Optional[float] = None  # wall-clock time (time.time()) by which the run must finish
+    partial: bool = False  # True when stages were cut short (deadline, or a step no tool could run)
+    degradations: List[str] = []  # which stages were cut short, for reporting
+    fallbacks: List[str] = []  # steps run with another tool than planned (e.g. around an open circuit); the answer is complete
+    speculative_refinement: bool = False  # start likely refinement searches while the critique runs
+    # "llm": RankResults over all results after gathering; "stream": local scoring as each tool returns;
+    # "llm_stream": RankResults in micro-batches while the remaining tools are still running
+    ranking_mode: str = "llm"
+    speculative_results: List[ResultRecord] = []  # results of those searches, used if the critique fails
+    use_memory: bool = True  # answer plan steps from the results of past runs (memory.py) when fresh ones match
+
+# Minimum time (seconds) worth giving a tool call; with less left the step is skipped
+MIN_TOOL_TIMEOUT = 0.5
+
+def time_left(state: AgentState) -> Optional[float]:
+    """Seconds until the run's deadline, or None when the run has no time budget."""
+    return None if state.deadline is None else state.deadline - time.time()
+
+def has_time_for(state: AgentState, *functions: str) -> bool:
+    """Whether the expected duration of the given BAML calls still fits in the remaining budget."""
+    remaining = time_left(state)
+    return remaining is None or remaining > sum(expected_latency(function) for function in functions)
+
+def llm_timeout(state: AgentState, *later: str) -> Optional[float]:
+    """Timeout for an LLM call: the remaining budget less the expected duration of the `later` calls it must leave time for."""
+    remaining = time_left(state)
+    return None if remaining is None else remaining - sum(expected_latency(function) for function in later)
+
+def tool_timeout(state: AgentState, default: float) -> float:
+    """Timeout for a tool call: the tool default, shortened so the answer can still be generated in time."""
+    remaining = time_left(state)
+    if remaining is None:
+        return default
+    return min(default, remaining - expected_latency("AnswerQuestion"))
+
+def degrade(state: AgentState, reason: str):
+    """Record that a stage was cut short (to meet the deadline, or for lack of a working tool), making
+    the answer partial, and return the matching state update."""
+    print(f"Degraded: {reason}")
+    state.partial = True
+    state.degradations = state.degradations + [reason]
+    return {"partial": True, "degradations": state.degradations}
+
+def fall_back(state: AgentState, reason: str):
+    """Record that a step ran with another tool than planned and return the matching state update.
+    Unlike degrade(), the answer is not partial: it is noted in the output, and cached as usual."""
+    print(f"Fallback: {reason}")
+    state.fallbacks = state.fallbacks + [reason]
+    return {"fallbacks": state.fallbacks}
+
+def match_price_question(question: str) -> Optional[str]:
+    """Return the CoinGecko ID if the question is a pure single-coin price question, otherwise None."""
+    text = " ".join(question.lower().replace("?", " ").replace("!", " ").split()).rstrip(". ")
+    # Strip trailing qualifiers repeatedly ("btc price in usd right now")
+    while True:
+        stripped = PRICE_QUESTION_SUFFIX.sub("", text)
+        if stripped == text:
+            break
+        text = stripped
+    for pattern in PRICE_QUESTION_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            coin_ids = find_coin_ids(match.group("coin"))
+            return coin_ids[0] if coin_ids else None
+    return None
 
 # Define node functions for each step in the workflow:
+def fast_path_node(state: AgentState):
+    """Answer pure price questions directly from the price tool, without any LLM call."""
+    if state.clarification_answer:
+        # Extra detail from the user means the question is not a plain price lookup
+        return {"answered_by_fast_path": False}
+    coin_id = match_price_question(state.question)
+    if not coin_id:
+        return {"answered_by_fast_path": False}
+    price_str = get_current_price(coin_id, timeout=tool_timeout(state, PRICE_TIMEOUT))
+    if not price_str:
+        # Price tool unavailable: let the full pipeline handle the question
+        return {"answered_by_fast_path": False}
+    source = coin_page_url(coin_id)
+    content = f"Current {coin_id} price: {price_str}"
+    state.relevant_results = [ResultRecord(content=content, link=source, query=coin_id, tool="PriceLookup")]
+    state.answer = Answer(
+        cited_answer=f"The current price of {coin_id.capitalize()} is {price_str} [0].",
+        references=[Source(index=0, source=source, source_type="PriceLookup")],
+    )
+    state.answered_by_fast_path = True
+    return {"relevant_results": state.relevant_results, "answer": state.answer, "answered_by_fast_path": True}
+
 def clarify_node(state: AgentState):
     """Use LLM to determine if clarification is needed and generate a clarifying question."""
-    state.clarification = b.ClarifyQuestion(question=state.question)
+    if not has_time_for(state, "ClarifyQuestion", "AnswerQuestion"):
+        # No time to ask (and wait for) the user: research the question as asked
+        state.clarification = Clarification(needed=False, question="")
+        return {"clarification": state.clarification}
+    try:
+        state.clarification = call_llm("ClarifyQuestion", timeout=llm_timeout(state, "AnswerQuestion"), question=state.question)
+    except Exception as e:
+        state.clarification = Clarification(needed=False, question="")
+        return {"clarification": state.clarification,
+                **degrade(state, f"{call_failed('ClarifyQuestion', e)}, researched the question as asked")}
     return {"clarification": state.clarification}  # update state
 
 def ask_user_node(state: AgentState):
     """Ask the user for clarification (if needed) and store the answer."""
+    if state.clarification and state.clarification.needed and not state.interactive:
+        # Nobody to ask (batch runs): research the question as asked
+        return {"clarification_answer": state.clarification_answer}
     if state.clarification and state.clarification.needed:
-        # Prompt the user and get input (in real usage, this would be interactive)
-        user_input = input(f"Agent: {state.clarification.question} ")  # waiting for user
-        state.clarification_answer = user_input.strip()
+        # Pause the run until the user replies: the state is checkpointed and no thread waits meanwhile.
+        # The run continues here with the value passed to DeepResearchAgent.resume()
+        from langgraph.types import interrupt
+        user_input = interrupt({"question": state.clarification.question})
+        state.clarification_answer = str(user_input or "").strip()
         # Optionally, update the question with clarification context (not strictly necessary)
     return {"clarification_answer": state.clarification_answer}
 
 def generate_subqueries_node(state: AgentState):
     """Use LLM to generate multiple search subqueries for the question."""
     clarif_detail = state.clarification_answer or ""
-    subqs = b.GenerateSubqueries(question=state.question, clarification_details=clarif_detail)
+    if not has_time_for(state, "GenerateSubqueries", "AnswerQuestion"):
+        # Search for the question itself instead of spending time on query expansion
+        state.subqueries = [f"{state.question} {clarif_detail}".strip()]
+        return {"subqueries": state.subqueries}
+    try:
+        subqs = call_llm("GenerateSubqueries", timeout=llm_timeout(state, "AnswerQuestion"),
+                         question=state.question, clarification_details=clarif_detail)
+    except Exception as e:
+        state.subqueries = [f"{state.question} {clarif_detail}".strip()]
+        return {"subqueries": state.subqueries,
+                **degrade(state, f"{call_failed('GenerateSubqueries', e)}, searched for the question itself")}
     # Ensure we have a list of strings (BAML returns a Python list for string[] output)
     state.subqueries = list(subqs) if isinstance(subqs, list) else subqs.queries  # .queries if wrapped in a model
     return {"subqueries": state.subqueries}
 
 def plan_node(state: AgentState):
-    """Use LLM to plan which tools to use for each aspect of the question."""
-    state.plan = b.PlanSteps(question=state.question, subqueries=state.subqueries)
+    """Plan which tools to use for each aspect of the question, locally when obvious, otherwise with the LLM."""
+    short_on_time = not has_time_for(state, "PlanSteps", "AnswerQuestion")
+    if state.local_planner or short_on_time:
+        plan, confidence = local_plan(state.subqueries)
+        if plan and (confidence >= PLANNER_CONFIDENCE_THRESHOLD or short_on_time):
+            metrics.incr("planner.local")
+            state.plan = plan
+            return {"plan": state.plan}
+    metrics.incr("planner.llm")
+    started = time.perf_counter()
+    try:
+        state.plan = call_llm("PlanSteps", timeout=llm_timeout(state, "AnswerQuestion"),
+                              question=state.question, subqueries=state.subqueries)
+    except Exception as e:
+        # The local plan whatever its confidence, or a web search for the question
+        plan, _ = local_plan(state.subqueries)
+        state.plan = plan or Plan(steps=[Step(tool=Tool.WebSearch, query=state.question)])
+        return {"plan": state.plan, **degrade(state, f"{call_failed('PlanSteps', e)}, planned the steps locally")}
+    metrics.observe("planner.llm_seconds", time.perf_counter() - started)
     return {"plan": state.plan}
 
+# Number of ranked results kept as answer context, and RankResults micro-batch size for "llm_stream"
+TOP_K_RESULTS = 5
+RANK_BATCH_SIZE = 5
+
+def run_step(tool: str, query: str, timeout: float) -> List[ResultRecord]:
+    """Execute one plan step and return its results tagged with the query that found them."""
+    if tool == "WebSearch":
+        # Results come back tagged with the query (used to measure subquery coverage)
+        return web_search(query, max_results=5, timeout=timeout)
+    if tool == "PriceLookup":
+        price_str = get_current_price(query, timeout=timeout)
+        coin_ids = find_coin_ids(query)
+        # Cite the coin's page when the price is known, as the fast path does
+        link = coin_page_url(coin_ids[0]) if price_str and coin_ids else None
+        return [ResultRecord(content=f"Current {query} price: {price_str or '(unavailable)'}", link=link, query=query, tool=tool)]
+    if tool == "LocalDocs":
+        # In-process index lookup (milliseconds), cited by file path and line
+        return local_docs(query, max_results=5)
+    return []
+
+def make_ranker(state: AgentState) -> Optional[IncrementalRanker]:
+    """Streaming ranker for the pipelined ranking modes (None for the default batch LLM ranking)."""
+    if state.ranking_mode == "stream" or (state.ranking_mode == "llm_stream" and not has_time_for(state, "RankResults", "AnswerQuestion")):
+        return IncrementalRanker(state.question, state.subqueries, top_k=TOP_K_RESULTS)
+    if state.ranking_mode == "llm_stream":
+        return IncrementalRanker(state.question, state.subqueries, top_k=TOP_K_RESULTS,
+                                 score_batch=lambda batch: rank_batch(state, batch),
+                                 batch_size=RANK_BATCH_SIZE)
+    return None
+
+def call_failed(function: str, error: Exception) -> str:
+    """How an LLM call went wrong (out of time, or failed on every client), for degradation reasons."""
+    return f"{function} timed out" if isinstance(error, TimeoutError) else f"{function} failed ({type(error).__name__})"
+
+def rank_batch(state: AgentState, batch: List[ResultRecord]) -> List[ResultRecord]:
+    """Score one micro-batch with RankResults, falling back to local ranking if it would overrun or fails."""
+    try:
+        return llm_rank(state, batch, top_k=len(batch))
+    except Exception as e:
+        degrade(state, f"{call_failed('RankResults micro-batch', e)}, ranked it locally")
+        return local_rank(state.question, state.subqueries, batch, top_k=len(batch))
+
+def recall_step(tool: str, query: str) -> Optional[List[ResultRecord]]:
+    """The Memory step: fresh results of past runs that answer a plan step, or None if the tool must run."""
+    if tool not in MEMORY_MAX_AGE:
+        return None
+    remembered = research_memory().recall(query, tool)
+    if len(remembered) < MIN_HITS[tool]:
+        metrics.incr("memory.misses")
+        return None
+    metrics.incr("memory.hits")
+    return remembered
+
 def gather_info_node(state: AgentState):
-    """Execute the plan: perform web searches and/or price lookups as specified, gather raw results."""
-    results = []
-    if state.plan:
-        for step in state.plan.steps:
-            tool = step.tool.value if hasattr(step.tool, "value") else str(step.tool)  # handle enum or string
-            query = step.query
-            if tool == "WebSearch":
-                # Perform web search for this query - returns list of dicts
-                search_res = web_search(query, max_results=5)
-                results.extend(search_res) # Extend directly as it's already list of dicts
-            elif tool == "PriceLookup":
-                price_str = get_current_price(query)
-                if price_str:
-                    # Format price result as a dict for consistency
-                    results.append({'content': f"Current {query} price: {price_str}", 'link': None})
-                else:
-                    results.append({'content': f"Current {query} price: (unavailable)", 'link': None})
-    state.raw_results = results
-    return {"raw_results": state.raw_results}
+    """Execute the plan: perform web searches and/or price lookups concurrently and gather raw results.
+
+    Steps that the research memory can answer with fresh results of past runs are not executed.
+    In the streaming ranking modes every tool result is ranked as soon as it arrives, so ranking is
+    done shortly after the last tool returns.
+    """
+    steps = []
+    remembered = []  # results of the steps answered from memory
+    update = {}
+    for step in (state.plan.steps if state.plan else []):
+        tool = step.tool.value if hasattr(step.tool, "value") else str(step.tool)  # handle enum or string
+        query = step.query
+        recalled = recall_step(tool, query) if state.use_memory else None
+        if recalled is not None:
+            # Answered from memory, even while the tool itself is unavailable
+            remembered.append(recalled)
+            continue
+        if tool == "LocalDocs" and not tool_available(tool):
+            # No documents ingested (the default install): search the web, as for any other question
+            metrics.incr("local_docs.web_fallbacks")
+            tool = "WebSearch"
+        if not tool_available(tool):
+            # The tool's endpoint is down (circuit open): fall back to a web search instead of waiting it out
+            if tool != "WebSearch" and tool_available("WebSearch"):
+                update.update(fall_back(state, f"{tool} is unavailable, searched the web for '{step.query}' instead"))
+                tool, query = "WebSearch", f"{step.query} price" if tool == "PriceLookup" else step.query
+            else:
+                update.update(degrade(state, f"{tool} is unavailable, skipped step '{step.query}'"))
+                continue
+        timeout = tool_timeout(state, SEARCH_TIMEOUT if tool == "WebSearch" else PRICE_TIMEOUT)
+        if timeout < MIN_TOOL_TIMEOUT:
+            update.update(degrade(state, f"ran out of time, skipped {tool} step '{step.query}' and any later steps"))
+            break
+        steps.append((tool, query, timeout))
+
+    ranker = make_ranker(state)
+    if ranker:
+        for results in remembered:
+            ranker.add(results)
+    step_results = [[] for _ in steps]
+    if steps:
+        with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="gather") as executor:
+            futures = {submit_in_context(executor, run_step, *step): index for index, step in enumerate(steps)}
+            for future in as_completed(futures):
+                step_results[futures[future]] = future.result()
+                if ranker:
+                    ranker.add(future.result())
+
+    if ranker:
+        # Already ranked: the raw results are not needed in the state
+        state.relevant_results = ranker.finish()
+        update["relevant_results"] = state.relevant_results
+        if state.partial:
+            update.update({"partial": True, "degradations": state.degradations})
+        return update
+    # Keep the plan order in raw_results regardless of completion order (remembered results first)
+    state.raw_results = [res for results in remembered + step_results for res in results]
+    update["raw_results"] = state.raw_results
+    return update
 
 def filter_results_node(state: AgentState):
-    """Use LLM via BAML to rank raw results and select the most relevant ones."""
-    raw_results_dicts: List[Dict[str, Optional[str]]] = state.raw_results or []
-    if not raw_results_dicts:
+    """Use LLM via BAML to rank raw results and select the most relevant ones.
+
+    The raw results are dropped from the state once ranked.
+    """
+    if state.ranking_mode != "llm":
+        # Already ranked while gathering
+        return {}
+
+    raw_results: List[ResultRecord] = state.raw_results or []
+    if not raw_results:
         state.relevant_results = []
         return {"relevant_results": state.relevant_results}
 
-    # Convert Python dicts to BAML ResultItem instances
-    raw_results_items = [ResultItem(content=d.get('content'), link=d.get('link')) for d in raw_results_dicts]
-
     # Define how many top results we want
-    top_k_to_request = 5
+    top_k_to_request = TOP_K_RESULTS
 
-    # Call the BAML function for ranking
-    ranked_results_items: List[RankedResultItem] = b.RankResults(
-        question=state.question,
-        subqueries=state.subqueries,
-        results=raw_results_items,
-        top_k=top_k_to_request
-    )
+    # Rank locally when the LLM ranking would not leave enough time to answer
+    if not has_time_for(state, "RankResults", "AnswerQuestion"):
+        update = degrade(state, "short on time, ranked results locally instead of with RankResults")
+        state.relevant_results = local_rank(state.question, state.subqueries, raw_results, top_k_to_request)
+        return {"relevant_results": state.relevant_results, "raw_results": [], **update}
 
-    # Convert the ranked BAML objects back to simple dictionaries for the state
-    # We only keep content and link as defined in AgentState.relevant_results
-    final_relevant_results = [
-        {'content': item.content, 'link': item.link}
-        for item in ranked_results_items
-        # Optionally filter by score client-side too, though the LLM was asked to filter
-        # if item.relevance_score >= 3
-    ]
+    # Call the BAML function for ranking
+    try:
+        final_relevant_results = llm_rank(state, raw_results, top_k_to_request)
+    except Exception as e:
+        update = degrade(state, f"{call_failed('RankResults', e)}, ranked results locally")
+        state.relevant_results = local_rank(state.question, state.subqueries, raw_results, top_k_to_request)
+        return {"relevant_results": state.relevant_results, "raw_results": [], **update}
 
     state.relevant_results = final_relevant_results
     print(f"LLM Filtered Results (Top {len(state.relevant_results)}): {state.relevant_results}") # Add some logging
 
-    return {"relevant_results": state.relevant_results}
+    return {"relevant_results": state.relevant_results, "raw_results": []}
+
+def llm_rank(state: AgentState, results: List[ResultRecord], top_k: int) -> List[ResultRecord]:
+    """Rank results with RankResults and return the top_k as records carrying their relevance_score."""
+    # BAML ResultItem views of the records, built without validation
+    raw_results_items = [r.to_result_item() for r in results]
+    ranked_results_items: List[RankedResultItem] = call_llm(
+        "RankResults",
+        timeout=llm_timeout(state, "AnswerQuestion"),
+        question=state.question,
+        subqueries=state.subqueries,
+        results=raw_results_items,
+        top_k=top_k
+    )
+    # Back to the original records (keeping their query, tool and fetch time), now with their scores
+    return apply_ranking(results, ranked_results_items)
 
 def answer_node(state: AgentState):
     """Use LLM to generate a final answer from the question and relevant context."""
-    relevant_context_dicts: List[Dict[str, Optional[str]]] = state.relevant_results or []
+    previous_answer = state.answer
+    relevant_context: List[ResultRecord] = state.relevant_results or []
     
-    # Create a list of ContextItem objects from the relevant results
-    context_items: List[ContextItem] = []
-    for res_dict in relevant_context_dicts:
-        context_items.append(
-            ContextItem(
-                content=res_dict.get('content', ''), 
-                source=res_dict.get('link') # Pass None if 'link' is missing
-            )
-        )
+    # ContextItem views of the relevant results (source is None for price lookups without a link)
+    context_items: List[ContextItem] = [res.to_context_item() for res in relevant_context]
+    if state.use_memory:
+        # Ranked results are what later runs can reuse
+        research_memory().add(relevant_context)
             
     # Call AnswerQuestion with the structured context list
-    state.answer = b.AnswerQuestion(question=state.question, context=context_items)
+    try:
+        state.answer = call_llm("AnswerQuestion", timeout=llm_timeout(state), question=state.question, context=context_items)
+    except Exception as e:
+        if state.answer:
+            # Keep the answer of the previous attempt
+            return degrade(state, f"{call_failed('AnswerQuestion', e)}, kept the previous answer")
+        state.answer = extractive_answer(relevant_context)
+        return {"answer": state.answer, **degrade(state, f"{call_failed('AnswerQuestion', e)}, returned the top results")}
+    if previous_answer is not None:
+        # This is a refinement attempt: record whether it actually changed the answer
+        metrics.incr("refinement.rounds")
+        if answer_changed(previous_answer, state.answer):
+            metrics.incr("refinement.changed")
     return {"answer": state.answer}
 
+def cited_sources(answer: Answer) -> set:
+    return {ref.source for ref in answer.references or [] if ref.source}
+
+def answer_changed(before: Answer, after: Answer, min_similarity: float = 0.9) -> bool:
+    """Whether a refined answer differs materially: new cited sources or a low word overlap."""
+    if cited_sources(before) != cited_sources(after):
+        return True
+    before_words, after_words = set(tokenize(before.cited_answer)), set(tokenize(after.cited_answer))
+    union = before_words | after_words
+    return bool(union) and len(before_words & after_words) / len(union) < min_similarity
+
+def passes_precheck(answer: Optional[Answer], results: List[ResultRecord], policy: RefinementPolicy) -> bool:
+    """Cheap local check that an answer is well supported, so the critique LLM call can be skipped."""
+    if not answer or not answer.cited_answer:
+        return False
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", answer.cited_answer.strip()) if len(s) > 20]
+    if not sentences:
+        return False
+    coverage = sum(1 for sentence in sentences if CITATION_PATTERN.search(sentence)) / len(sentences)
+    if coverage < policy.min_citation_coverage:
+        return False
+
+    cited = {int(index) for index in CITATION_PATTERN.findall(answer.cited_answer)}
+    if any(index >= len(results) for index in cited):
+        return False  # citations that do not point at a context item
+    cited_results = [results[index] for index in sorted(cited)]
+    if len({r.link or r.content for r in cited_results}) < policy.min_sources:
+        return False
+    scores = [r.relevance_score for r in cited_results if r.relevance_score is not None]
+    return bool(scores) and sum(scores) / len(scores) >= policy.min_relevance
+
+def extractive_answer(results: List[ResultRecord], max_items: int = 3) -> Answer:
+    """Build a cited answer from the top results without an LLM call (used when out of time)."""
+    sentences = []
+    references = []
+    for index, result in enumerate(results[:max_items]):
+        if not result.content:
+            continue
+        sentences.append(f"{result.content} [{index}]")
+        if result.link:
+            references.append(Source(index=index, source=result.link, source_type=result.tool))
+    text = " ".join(sentences) or "No information could be gathered within the time budget."
+    return Answer(cited_answer=text, references=references)
+
 def critique_node(state: AgentState):
     """Use LLM to critique the answer for completeness/correctness."""
+    if not has_time_for(state, "CritiqueAnswer", "AnswerQuestion"):
+        # A critique only helps if there is time left to act on it
+        state.critique = None
+        return {"critique": None, **degrade(state, "short on time, skipped the critique loop")}
+    if state.refinement.precheck and passes_precheck(state.answer, state.relevant_results, state.refinement):
+        metrics.incr("critique.skipped")
+        state.critique = Critique(is_good=True, missing_info="")
+        return {"critique": state.critique}
     # Extract the answer string from the state object's 'cited_answer' field
     answer_text = ""
     if state.answer:
         # Access the correct field name from the Answer class
         answer_text = state.answer.cited_answer 
-    
-    state.critique = b.CritiqueAnswer(question=state.question, answer=answer_text)
-    return {"critique": state.critique}
+
+    # Optionally start the likely refinement searches now, in parallel with the critique
+    speculation = None
+    if state.speculative_refinement and state.attempt_count < state.refinement.max_attempts:
+        speculation_queries = speculative_queries(state)
+        if speculation_queries:
+            metrics.incr("speculation.started")
+            speculation = submit_in_context(
+                _speculation_executor, multi_search, speculation_queries, REFINEMENT_RESULTS_PER_QUERY, tool_timeout(state, SEARCH_TIMEOUT)
+            )
+
+    try:
+        # Leaves time for the refined answer a rejection leads to
+        state.critique = call_llm("CritiqueAnswer", timeout=llm_timeout(state, "AnswerQuestion"),
+                                  question=state.question, answer=answer_text)
+    except Exception as e:
+        if speculation is not None:
+            speculation.cancel()
+            metrics.incr("speculation.discarded")
+        # The run ends with the current answer
+        state.critique = None
+        return {"critique": None, **degrade(state, f"{call_failed('CritiqueAnswer', e)}, kept the answer")}
+    metrics.incr("critique.calls")
+    update = {"critique": state.critique}
+    if not state.critique.is_good:
+        metrics.incr("critique.rejected")
+    if speculation is not None:
+        if state.critique.is_good:
+            # Not needed: drop the searches (cancelled if they have not started yet)
+            speculation.cancel()
+            metrics.incr("speculation.discarded")
+        else:
+            seen = {canonical_link(res.link) for res in state.relevant_results if res.link}
+            state.speculative_results = [
+                res for results in speculation.result() for res in results
+                if canonical_link(res.link) not in seen
+            ]
+            update["speculative_results"] = state.speculative_results
+    return update
+
+def refinement_report():
+    """How often the critique ran, was skipped by the pre-check, and how often refinement changed the answer."""
+    calls = metrics.count("critique.calls")
+    skipped = metrics.count("critique.skipped")
+    rounds = metrics.count("refinement.rounds")
+    changed = metrics.count("refinement.changed")
+    return {
+        "critique_calls": calls,
+        "critique_skipped_by_precheck": skipped,
+        "critique_rejections": metrics.count("critique.rejected"),
+        "refinement_rounds": rounds,
+        "refinements_that_changed_answer": changed,
+        "refinement_change_rate": changed / rounds if rounds else None,
+        "speculative_searches_started": metrics.count("speculation.started"),
+        "speculative_searches_used": metrics.count("speculation.used"),
+        "speculative_searches_discarded": metrics.count("speculation.discarded"),
+        "refinement_searches_saved": metrics.count("speculation.searches_saved"),
+    }
+
+# Refinement limits: focused queries per critique, results per query, results kept as answer context
+MAX_REFINEMENT_QUERIES = 4
+REFINEMENT_RESULTS_PER_QUERY = 3
+MAX_CONTEXT_RESULTS = 10
+
+# Runs speculative refinement searches in the background while CritiqueAnswer is running
+_speculation_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative-search")
+
+def focus_query(fragment: str, question: str, min_words: int = 3) -> str:
+    """Add the question's key terms to a short query fragment ("risks") so it can be searched on its own."""
+    if len(fragment.split()) >= min_words:
+        return fragment
+    fragment_words = set(tokenize(fragment))
+    topic = [word for word in dict.fromkeys(tokenize(question)) if word not in fragment_words][:4]
+    return " ".join([fragment] + topic)
+
+def speculative_queries(state: AgentState, max_queries: int = MAX_REFINEMENT_QUERIES) -> List[str]:
+    """Refinement searches likely to be needed: web subqueries none of whose results the answer cites."""
+    cited = {int(index) for index in CITATION_PATTERN.findall(state.answer.cited_answer if state.answer else "")}
+    covered = {state.relevant_results[i].query for i in cited if i < len(state.relevant_results)}
+    searched = [step.query for step in (state.plan.steps if state.plan else []) if step.tool == Tool.WebSearch]
+    # The original query would return the same results again, so search a variant enriched with the question
+    return [focus_query(query, state.question, min_words=len(query.split()) + 1)
+            for query in searched if query not in covered][:max_queries]
+
+def split_missing_info(missing: str, question: str, max_queries: int = MAX_REFINEMENT_QUERIES) -> List[str]:
+    """Split the critique's missing-info into focused search queries, one per missing aspect."""
+    fragments = re.split(r"[\n;,]|\band\b|&", missing)
+    queries = []
+    for fragment in fragments:
+        fragment = fragment.strip(" .-*")
+        if len(fragment) < 3:
+            continue
+        # Very short fragments are searched together with the question's key terms
+        query = focus_query(fragment, question)
+        if query.lower() not in (q.lower() for q in queries):
+            queries.append(query)
+    return queries[:max_queries] or ([missing] if missing else [])
+
+def merge_ranked(existing: List[ResultRecord], new_results: List[ResultRecord], limit: int = MAX_CONTEXT_RESULTS):
+    """Merge newly scored results into the ranked list (best first), skipping links already present."""
+    seen = {canonical_link(res.link) for res in existing if res.link}
+    merged = list(existing)
+    for res in new_results:
+        link = canonical_link(res.link)
+        if link and link in seen:
+            continue
+        seen.add(link)
+        merged.append(res)
+    merged.sort(key=lambda res: -(res.relevance_score or 0))  # stable: ties keep their order
+    return merged[:limit]
 
 def additional_search_node(state: AgentState):
     """If the answer was insufficient, search for the missing information identified by critique."""
     missing = state.critique.missing_info if state.critique else ""
     missing = missing.strip()
-    new_info_results: List[Dict[str, Optional[str]]] = [] # Expecting list of dicts
-    if missing:
-        # Use the missing info string as a new search query
-        new_info_results = web_search(missing, max_results=3) # Returns list of dicts
-        
-    # Append new search results (if any) to the relevant results for a second attempt
+    new_info_results: List[ResultRecord] = []
+    missing_queries = split_missing_info(missing, state.question) if missing else []
+    queries = missing_queries
+    update = {}
+    if state.speculative_results:
+        # Searches started alongside the critique: only search for aspects they do not cover yet
+        metrics.incr("speculation.used")
+        new_info_results = list(state.speculative_results)
+        speculative_words = set(tokenize(" ".join(res.content for res in new_info_results)))
+        uncovered = [q for q in queries if len(set(tokenize(q)) & speculative_words) < len(set(tokenize(q))) / 2]
+        metrics.incr("speculation.searches_saved", len(queries) - len(uncovered))
+        queries = uncovered
+        state.speculative_results = []
+        update["speculative_results"] = []
+    if queries:
+        # Search all missing aspects concurrently
+        per_query = multi_search(queries, max_results=REFINEMENT_RESULTS_PER_QUERY, timeout=tool_timeout(state, SEARCH_TIMEOUT))
+        new_info_results += [res for results in per_query for res in results]
+
     if new_info_results:
-        # Ensure we don't add duplicates (simple check based on link, if available)
-        existing_links = {res.get('link') for res in state.relevant_results if res.get('link')}
-        for new_res in new_info_results:
-            if new_res.get('link') not in existing_links:
-                 state.relevant_results.append(new_res)
-            # Limit total relevant results if needed, e.g., state.relevant_results = state.relevant_results[-10:] 
+        # Score only the new results and merge them into the ranked context, deduplicated by canonical link
+        scored = local_rank(state.question, missing_queries, new_info_results, top_k=len(new_info_results))
+        state.relevant_results = merge_ranked(state.relevant_results, scored)
 
     # Increment attempt count
     state.attempt_count += 1
-    return {"relevant_results": state.relevant_results, "attempt_count": state.attempt_count}
+    return {"relevant_results": state.relevant_results, "attempt_count": state.attempt_count, **update}
+
+# Tools whose results go stale within minutes: DeepResearchAgent.refresh() runs their steps again every
+# time. Other steps run again once their results are older than the tool's TTL in ANSWER_TTLS.
+TIME_SENSITIVE_TOOLS = {"PriceLookup"}
+
+def stale_steps(results: List[ResultRecord], now: float) -> List[tuple]:
+    """The (tool, query) steps behind a stored run's ranked results whose data must be fetched again."""
+    steps = []
+    for res in results:
+        step = (res.tool, res.query)
+        if not res.query or step in steps:
+            continue
+        if res.tool in TIME_SENSITIVE_TOOLS or now - res.fetched_at > ANSWER_TTLS.get(res.tool, DEFAULT_TTL):
+            steps.append(step)
+    return steps
+
+def context_hash(results: List[ResultRecord]) -> str:
+    """Digest of the answer context as AnswerQuestion sees it: each result's content and source, in order."""
+    digest = hashlib.sha256()
+    for res in results:
+        digest.update(f"{res.content}\0{res.link or ''}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+def refresh_context(state: AgentState, fresh: Dict[tuple, List[ResultRecord]]) -> List[ResultRecord]:
+    """The ranked context with the results of the re-run steps in place of their stored results.
+
+    A source still returned keeps its place and score (a new price or a revised page is as relevant
+    as before). Sources new to the context only take the places of stored ones that are no longer
+    returned, and only they are scored, locally as refinement results are. Unchanged data gives an
+    unchanged context.
+    """
+    returned = {}  # canonical link -> fresh result (results without a link cannot be cited)
+    for res in (res for results in fresh.values() for res in results if res.link):
+        returned.setdefault(canonical_link(res.link), res)
+    context, freed = [], 0
+    for res in state.relevant_results:
+        if (res.tool, res.query) not in fresh:
+            context.append(res)
+            continue
+        update = returned.get(canonical_link(res.link)) if res.link else None
+        if update is None:
+            freed += 1
+        else:
+            context.append(update.scored(res.relevance_score))
+    seen = {canonical_link(res.link) for res in context if res.link}
+    new = [res for link, res in returned.items() if link not in seen]
+    if not new or not freed:
+        return context
+    scored = local_rank(state.question, state.subqueries, new, top_k=freed)
+    metrics.incr("refresh.new_sources", len(scored))
+    return merge_ranked(context, scored, limit=len(state.relevant_results))
+
+class RunResult(BaseModel):
+    """Outcome of starting or resuming a run: either the final output or a pending clarification question."""
+    run_id: str
+    status: str  # "done" or "needs_clarification"
+    clarification_question: Optional[str] = None
+    output: Optional[str] = None
 
 class DeepResearchAgent:
-    def __init__(self, graph: StateGraph, max_attempt_count: int = 2):
+    def __init__(self, graph, max_attempt_count: Optional[int] = None, local_planner: bool = True,
+                 time_budget: Optional[float] = None, refinement_policy: Optional[RefinementPolicy] = None,
+                 speculative_refinement: bool = False, ranking_mode: str = "llm", interactive: bool = True,
+                 use_memory: bool = True, answer_cache: Optional[AnswerCache] = default_answer_cache):
         self.graph = graph
-        self.max_attempt_count = max_attempt_count
+        if refinement_policy is None:
+            refinement_policy = RefinementPolicy() if max_attempt_count is None else RefinementPolicy(max_attempts=max_attempt_count)
+        elif max_attempt_count is not None and max_attempt_count != refinement_policy.max_attempts:
+            raise ValueError(f"max_attempt_count={max_attempt_count} contradicts the refinement policy's "
+                             f"max_attempts={refinement_policy.max_attempts}; set only one of them")
+        self.refinement_policy = refinement_policy
+        self.max_attempt_count = refinement_policy.max_attempts
+        self.speculative_refinement = speculative_refinement
+        self.ranking_mode = ranking_mode
+        self.interactive = interactive
+        self.use_memory = use_memory
+        self.answer_cache = answer_cache  # None: every question runs the graph
+        self.local_planner = local_planner
+        self.time_budget = time_budget  # default wall-clock budget per run in seconds (None = unlimited)
 
-    def run(self, question: str, clarification_answer: str = None) -> str:
+    def start(self, question: str, clarification_answer: str = None, time_budget: Optional[float] = None,
+              run_id: Optional[str] = None, on_step: Optional[Callable[[str], None]] = None) -> RunResult:
+        """Start a run. Returns as soon as it finishes or pauses for a clarification from the user.
+
+        `on_step` is called with the name of every node as it completes (progress reporting).
+        A question answered recently (or a near-duplicate of it) is served from the answer cache; a
+        question whose cached answer has expired refreshes the checkpointed run behind it (refresh()).
+        """
+        if self.answer_cache is not None:
+            cached = self.answer_cache.get(question, clarification_answer, stale=bool(self.graph.checkpointer))
+            if cached is not None and not cached.expired:
+                print(f"Answer cache hit: {cached.question!r}")
+                return RunResult(run_id=run_id or uuid.uuid4().hex, status="done", output=cached.output)
+            if cached is not None and cached.run_id:
+                try:
+                    return self.refresh(cached.run_id)
+                except (KeyError, ValueError) as e:
+                    print(f"Could not refresh run {cached.run_id} ({e}), running the question again")
         # Initialize state with the question and optional pre-provided clarification answer
-        state = AgentState(question=question, clarification_answer=clarification_answer)
+        time_budget = time_budget if time_budget is not None else self.time_budget
+        state = AgentState(
+            question=question,
+            clarification_answer=clarification_answer,
+            local_planner=self.local_planner,
+            refinement=self.refinement_policy,
+            speculative_refinement=self.speculative_refinement,
+            ranking_mode=self.ranking_mode,
+            interactive=self.interactive,
+            use_memory=self.use_memory,
+            deadline=time.time() + time_budget if time_budget is not None else None,
+        )
         if clarification_answer:
             # If clarification answer is given, assume clarification was needed
             state.clarification = Clarification(needed=True, question="")  # dummy Clarification since user provided detail
+        run_id = run_id or uuid.uuid4().hex
         # Execute the graph
-        final_state: AgentState = self.graph.invoke(state)  # Use invoke() instead of run()
-        
+        final_state = self._invoke(state, self._config(run_id), on_step)
+        return self._result(run_id, final_state)
+
+    def resume(self, run_id: str, clarification_answer: Optional[str] = None,
+               on_step: Optional[Callable[[str], None]] = None) -> RunResult:
+        """Continue a run from its last checkpoint.
+
+        With a clarification answer, a run waiting for clarification continues with it. Without one,
+        a run that was interrupted (crash, timeout, restart) continues after its last completed node,
+        so the LLM calls and searches already made are not repeated.
+        """
+        config = self._config(run_id)
+        if clarification_answer is not None:
+            from langgraph.types import Command
+            final_state = self._invoke(Command(resume=clarification_answer), config, on_step)
+            return self._result(run_id, final_state)
+        snapshot = self.graph.get_state(config)
+        if not snapshot.values:
+            raise KeyError(f"No checkpointed run with id {run_id}")
+        if snapshot.next and not any(task.interrupts for task in snapshot.tasks):
+            print(f"Resuming run {run_id} at {', '.join(snapshot.next)}")
+            return self._result(run_id, self._invoke(None, config, on_step))
+        # Already finished, or still waiting for clarification
+        return self._result(run_id, snapshot.values)
+
+    def refresh(self, run_id: str) -> RunResult:
+        """Bring a finished checkpointed run up to date without running its pipeline again.
+
+        Only the steps whose data is time-sensitive (TIME_SENSITIVE_TOOLS) or older than its tool's TTL
+        are run again (stale_steps()), and only sources new to the context are scored
+        (refresh_context()). The answer is regenerated only when the context hash changed, and is not
+        critiqued again. The refreshed state is checkpointed, so the run can be refreshed again later.
+        """
+        if not self.graph.checkpointer:
+            raise ValueError("refreshing a run needs a checkpointer")
+        config = self._config(run_id)
+        snapshot = self.graph.get_state(config)
+        if not snapshot.values:
+            raise KeyError(f"No checkpointed run with id {run_id}")
+        if snapshot.next or not snapshot.values.get("answer"):
+            raise ValueError(f"run {run_id} has not finished")
+        state = AgentState(**snapshot.values)
+        state.deadline = None
+        metrics.incr("refresh.runs")
+        if state.answered_by_fast_path:
+            # A price and a templated answer: simply look the price up again
+            update = fast_path_node(state)
+            if update["answered_by_fast_path"]:
+                self.graph.update_state(config, update, as_node="fast_path")
+            return self._result(run_id, self.graph.get_state(config).values)
+
+        stale = stale_steps(state.relevant_results, time.time())
+        steps = [(tool, query) for tool, query in stale if tool_available(tool)]
+        fresh = {}
+        if steps:
+            with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="refresh") as executor:
+                futures = {submit_in_context(executor, run_step, tool, query,
+                                             SEARCH_TIMEOUT if tool == "WebSearch" else PRICE_TIMEOUT): (tool, query)
+                           for tool, query in steps}
+                for future in as_completed(futures):
+                    results = future.result()
+                    # A failed call (no results, or a price without its source) keeps the stored results
+                    if any(res.link for res in results):
+                        fresh[futures[future]] = results
+        metrics.incr("refresh.steps", len(fresh))
+        context = refresh_context(state, fresh)
+        update = {"relevant_results": context}
+        if context_hash(context) != context_hash(state.relevant_results):
+            metrics.incr("refresh.answers_regenerated")
+            state.relevant_results = context
+            state.answer = None  # a new answer, not a refinement of the stored one
+            update.update(answer_node(state))
+        else:
+            # Same context, same answer: only the fetch times move on
+            metrics.incr("refresh.answers_kept")
+        print(f"Refreshed run {run_id}: {len(fresh)} of {len(stale)} stale steps fetched again, "
+              f"answer {'regenerated' if 'answer' in update else 'kept'}")
+        self.graph.update_state(config, update, as_node="generate_critique")
+        return self._result(run_id, self.graph.get_state(config).values)
+
+    def run(self, question: str, clarification_answer: str = None, time_budget: Optional[float] = None,
+            run_id: Optional[str] = None) -> str:
+        """Run to completion, asking for clarification on the terminal if needed (CLI usage)."""
+        result = self.start(question, clarification_answer=clarification_answer, time_budget=time_budget, run_id=run_id)
+        return self.finish_interactively(result)
+
+    def finish_interactively(self, result: RunResult) -> str:
+        """Answer clarification questions on the terminal until the run is done, and return its output."""
+        while result.status == "needs_clarification":
+            user_input = input(f"Agent: {result.clarification_question} ")  # waiting for user
+            result = self.resume(result.run_id, user_input)
+        return result.output
+
+    def _invoke(self, graph_input, config, on_step: Optional[Callable[[str], None]] = None):
+        """Run the graph and return the final state values, reporting completed nodes to on_step."""
+        if on_step is None:
+            return self.graph.invoke(graph_input, config)
+        final_state = None
+        for mode, chunk in self.graph.stream(graph_input, config, stream_mode=["updates", "values"]):
+            if mode == "values":
+                final_state = chunk
+                continue
+            for node in chunk:
+                if not node.startswith("__"):  # skip "__interrupt__"
+                    on_step(node)
+        return final_state
+
+    @staticmethod
+    def _config(run_id: str):
+        return {"configurable": {"thread_id": run_id}}
+
+    def _result(self, run_id: str, final_state) -> RunResult:
+        if self.graph.checkpointer:
+            snapshot = self.graph.get_state(self._config(run_id))
+            pending = [i for task in snapshot.tasks for i in task.interrupts]
+            if pending:
+                return RunResult(run_id=run_id, status="needs_clarification",
+                                 clarification_question=pending[0].value.get("question"))
+        output = self.format_output(final_state)
+        if self.answer_cache is not None and final_state.get("answer") and not final_state.get("partial"):
+            # Answers cut short by the deadline or a failing tool are not worth serving again
+            tools = {record.tool for record in final_state.get("relevant_results") or [] if record.tool}
+            if final_state.get("answered_by_fast_path"):
+                tools.add("PriceLookup")
+            self.answer_cache.put(final_state["question"], final_state.get("clarification_answer"), output, tools,
+                                  run_id=run_id if self.graph.checkpointer else None)
+        return RunResult(run_id=run_id, status="done", output=output)
+
+    @staticmethod
+    def format_output(final_state) -> str:
+        """Combine the final answer and its sorted references into the output string."""
         # Return the actual answer string from the 'cited_answer' field
         # Also include references if available (optional, depending on use case)
         final_answer_text = ""
         references_list = []
-        if final_state['answer']:
+        if final_state.get('answer'):
             final_answer_text = final_state['answer'].cited_answer
             if hasattr(final_state['answer'], 'references') and final_state['answer'].references:
                  # Create a list of tuples (index, formatted_string) for sorting
@@ -199,13 +891,32 @@ class DeepResearchAgent:
              # The join part remains the same, just using the sorted list
              output += "\n\nReferences:\n" + "\n".join(f"- {ref_source}" for ref_source in references_list)
 
+        if final_state.get('partial'):
+            reasons = final_state.get('degradations') or ["research was cut short"]
+            output += f"\n\n(Partial answer: {'; '.join(reasons)}.)"
+        if final_state.get('fallbacks'):
+            output += f"\n\n(Note: {'; '.join(final_state['fallbacks'])}.)"
+
         return output or "No answer generated." # Return the combined string
 
-def build_agent_graph():
+def build_agent_graph(checkpointer=None):
+    """Build and compile the agent graph.
+
+    State is checkpointed after every node so runs can be resumed after a clarification
+    interrupt or a crash. `checkpointer` is a checkpointer instance or a spec for
+    make_checkpointer() ("memory", "sqlite:<path>"); the default is the SQLite database at
+    DEFAULT_CHECKPOINT_PATH. Pass checkpointer=False to compile without one (only for
+    non-interactive runs).
+    """
+    # LangGraph is imported on first build: it is the slowest import of the agent
+    from langgraph.graph import StateGraph, END
+    from checkpointing import make_checkpointer
+
     # Build the LangGraph state graph
     graph_builder = StateGraph(AgentState)
 
     # Add nodes to the graph
+    graph_builder.add_node("fast_path", fast_path_node)
     graph_builder.add_node("clarify", clarify_node)
     graph_builder.add_node("ask_user", ask_user_node)
     graph_builder.add_node("generate_subqueries", generate_subqueries_node)
@@ -217,7 +928,20 @@ def build_agent_graph():
     graph_builder.add_node("additional_search", additional_search_node)
 
     # Define edges and conditional edges
-    graph_builder.set_entry_point("clarify") # Use set_entry_point instead of add_edge from START
+    graph_builder.set_entry_point("fast_path") # Use set_entry_point instead of add_edge from START
+
+    # Conditional edge after the fast path: pure price questions are already answered
+    def decide_fast_path(state: AgentState):
+        return END if state.answered_by_fast_path else "clarify"
+
+    graph_builder.add_conditional_edges(
+        "fast_path",
+        decide_fast_path,
+        {
+            END: END,
+            "clarify": "clarify",
+        }
+    )
 
     # Conditional edge after clarify: Decide whether to ask user or generate subqueries
     def decide_clarification_path(state: AgentState):
@@ -246,9 +970,13 @@ def build_agent_graph():
 
     # Conditional edge after critique: Decide whether to end or do additional search
     def decide_critique_path(state: AgentState):
-        if state.critique and (state.critique.is_good or state.attempt_count >= 2):
+        if state.critique is None and state.partial:
+            # Critique was skipped to meet the deadline
+            return END
+        max_attempts = state.refinement.max_attempts
+        if state.critique and (state.critique.is_good or state.attempt_count >= max_attempts):
             return END
-        elif state.critique and not state.critique.is_good and state.attempt_count < 2:
+        elif state.critique and not state.critique.is_good and state.attempt_count < max_attempts:
             return "additional_search"
         else:
             # Fallback case, should ideally not be reached if critique is always present
@@ -269,22 +997,78 @@ def build_agent_graph():
     graph_builder.add_edge("additional_search", "generate_answer")
 
     # Build the graph
-    agent_graph = graph_builder.compile()
+    if checkpointer is None or isinstance(checkpointer, str):
+        checkpointer = make_checkpointer(checkpointer)
+    agent_graph = graph_builder.compile(checkpointer=checkpointer or None)
     return agent_graph
 
+@functools.lru_cache(maxsize=None)
+def get_agent_graph(checkpointer=None):
+    """The compiled graph for a checkpointer spec, built once per process and shared by all callers
+    (compiled graphs are stateless; runs are kept apart by their thread id)."""
+    return build_agent_graph(checkpointer)
+
+def __getattr__(name):
+    # `agent:agent_graph` is the entry point in langgraph.json. It is built on first access, so
+    # importing the module stays cheap, and without a checkpointer: the LangGraph server provides one.
+    if name == "agent_graph":
+        return get_agent_graph(False)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run the Deep Research Agent")
     parser.add_argument("--question", type=str, help="The question to research")
+    parser.add_argument("--no-local-planner", action="store_true", help="Always plan with the PlanSteps LLM call")
+    parser.add_argument("--stats", action="store_true", help="Print planner and metrics statistics after the run")
+    parser.add_argument("--time-budget", type=float, help="Wall-clock budget for the run in seconds")
+    parser.add_argument("--max-attempts", type=int, default=2, help="Maximum number of answer attempts (critique loop)")
+    parser.add_argument("--always-critique", action="store_true", help="Disable the local pre-check before CritiqueAnswer")
+    parser.add_argument("--speculative-refinement", action="store_true",
+                        help="Start likely refinement searches in parallel with the critique")
+    parser.add_argument("--ranking", choices=["llm", "stream", "llm_stream"], default="llm",
+                        help="llm: rank after gathering; stream: local top-k as results arrive; llm_stream: LLM micro-batches as results arrive")
+    parser.add_argument("--checkpoint", type=str, help='Checkpoint store: "memory", "sqlite:<path>" (default: sqlite:checkpoints.sqlite)')
+    parser.add_argument("--resume", type=str, metavar="RUN_ID", help="Continue a checkpointed run from its last completed node")
+    parser.add_argument("--no-memory", action="store_true", help="Do not reuse or remember results of past runs")
+    parser.add_argument("--refresh", type=str, metavar="RUN_ID",
+                        help="Update a finished checkpointed run: re-run only its stale tool steps, re-answer only if the context changed")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Always run the graph, even for a recently answered question")
+    parser.add_argument("--search-backend", choices=sorted(search_backends.BACKENDS),
+                        help="Backend of the WebSearch tool (default: HEKMATICA_SEARCH_BACKEND or duckduckgo)")
     args = parser.parse_args()
+    if args.search_backend:
+        search_backends.set_default_backend(args.search_backend)
 
-    agent_graph = build_agent_graph()
-    agent = DeepResearchAgent(agent_graph)
-    user_question = (
-        args.question
-        or "What were the key factors leading to the fall of the Roman Empire?"
+    agent_graph = get_agent_graph(args.checkpoint)
+    agent = DeepResearchAgent(
+        agent_graph,
+        local_planner=not args.no_local_planner,
+        time_budget=args.time_budget,
+        refinement_policy=RefinementPolicy(max_attempts=args.max_attempts, precheck=not args.always_critique),
+        speculative_refinement=args.speculative_refinement,
+        ranking_mode=args.ranking,
+        use_memory=not args.no_memory,
+        answer_cache=None if args.no_answer_cache else default_answer_cache,
     )
-    print(f"User: {user_question}")
-    # Run the agent (this will ask for clarification interactively if needed)
-    final_output_string = agent.run(user_question) # Returns a string with answer + references
+    if args.resume:
+        final_output_string = agent.finish_interactively(agent.resume(args.resume))
+    elif args.refresh:
+        final_output_string = agent.refresh(args.refresh).output
+    else:
+        user_question = (
+            args.question
+            or "What were the key factors leading to the fall of the Roman Empire?"
+        )
+        run_id = uuid.uuid4().hex
+        print(f"User: {user_question}")
+        print(f"Run id: {run_id} (continue an interrupted run with --resume {run_id})")
+        # Run the agent (this will ask for clarification interactively if needed)
+        final_output_string = agent.run(user_question, run_id=run_id) # Returns a string with answer + references
     # Print the final output string
     print(f"Agent Output:\n{final_output_string}")
+    if args.stats:
+        print("Planner:", json.dumps(planner_report(), indent=2))
+        print("Refinement:", json.dumps(refinement_report(), indent=2))
+        print("LLM clients:", json.dumps(router.report(), indent=2))
+        print("Answer cache:", json.dumps(default_answer_cache.stats(), indent=2))
+        print("Metrics:", json.dumps(metrics.snapshot(), indent=2))
@@ -0,0 +1,184 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+from embeddings import HashingEmbedder
+from metrics import metrics
+from ranking import content_stems
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# How long an answer is served from the cache, by the most time-sensitive tool it used (seconds)
+ANSWER_TTLS = {
+    "PriceLookup": 60,
+    "LocalDocs": 60 * 60,
+    "WebSearch": 6 * 60 * 60,
+}
+DEFAULT_TTL = 6 * 60 * 60  # answers that used no tool (or an unlisted one)
+
+# Cosine similarity from which a cached question is a near-duplicate candidate. Hashed embeddings
+# rate "fall of Rome" and "rise of Rome" as close as true rewordings, so candidates must also use the
+# same content words (see ranking.content_stems()).
+NEAR_DUPLICATE_SIMILARITY = 0.75
+MAX_ENTRIES = 5000
+
+NORMALIZE_PATTERN = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase words only: questions differing in case, punctuation or spacing share a cache key."""
+    return " ".join(NORMALIZE_PATTERN.sub(" ", (text or "").lower()).split())
+
+
+@dataclass
+class CachedAnswer:
+    question: str  # normalized question
+    clarification: str  # normalized clarification answer ("" if none)
+    output: str  # the agent's output: cited answer and references
+    tools: tuple  # tools the answer's results came from
+    created_at: float
+    expires_at: float
+    row: int  # row of the question's embedding
+    stems: frozenset  # content_stems() of the question
+    run_id: Optional[str] = None  # the checkpointed run that produced the answer (DeepResearchAgent.refresh())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at <= time.time()
+
+
+class AnswerCache:
+    """Answers to previous questions, in front of DeepResearchAgent runs (thread-safe, in-process).
+
+    Lookups match the normalized question and clarification exactly, then near-duplicates: among
+    the cached questions with a HashingEmbedder cosine similarity of at least `similarity`, the most
+    similar one with the same clarification and the same content words. Entries expire after
+    the TTL of the most time-sensitive tool their answer used (ANSWER_TTLS); the least recently
+    stored entry is evicted when the cache is full.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, similarity: float = NEAR_DUPLICATE_SIMILARITY,
+                 embedder: Optional[HashingEmbedder] = None):
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.embedder = embedder or HashingEmbedder()
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, CachedAnswer]" = OrderedDict()  # (question, clarification) -> entry
+        # Question embeddings, one row per entry: allocated on the first put, grown on demand up to max_entries rows
+        self._vectors: Optional["np.ndarray"] = None
+        self._row_keys: Dict[int, tuple] = {}
+        self._free_rows = []  # rows of removed entries
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def ttl(tools: Iterable[str]) -> float:
+        return min((ANSWER_TTLS.get(tool, DEFAULT_TTL) for tool in tools), default=DEFAULT_TTL)
+
+    def get(self, question: str, clarification: Optional[str] = None, stale: bool = False) -> Optional[CachedAnswer]:
+        """The cached answer to this question or a near-duplicate of it, or None.
+
+        With `stale`, an expired answer to this very question is returned too (and counted as a miss),
+        so that its run can be refreshed instead of run again; check CachedAnswer.expired.
+        """
+        key = (normalize(question), normalize(clarification))
+        vector = self.embedder.embed(key[0])
+        with self._lock:
+            now = time.time()
+            entry = self._entries.get(key)
+            expired = None
+            if entry is not None and entry.expires_at <= now:
+                self.expired += 1
+                if stale:
+                    expired = entry
+                else:
+                    self._remove(key)
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                metrics.incr("answer_cache.hits")
+                return entry
+            entry = self._nearest(key, vector, now)
+            if entry is not None:
+                self.near_hits += 1
+                metrics.incr("answer_cache.near_hits")
+                return entry
+            self.misses += 1
+            metrics.incr("answer_cache.misses")
+            return expired
+
+    def _nearest(self, key: tuple, vector: "np.ndarray", now: float) -> Optional[CachedAnswer]:
+        import numpy as np
+        if not self._entries:
+            return None
+        similarity = self._vectors @ vector
+        stems = content_stems(key[0])
+        for row in np.argsort(-similarity)[:5]:
+            if similarity[row] < self.similarity:
+                break
+            entry = self._entries.get(self._row_keys.get(int(row)))
+            if entry is not None and entry.expires_at > now and entry.clarification == key[1] and entry.stems == stems:
+                return entry
+        return None
+
+    def put(self, question: str, clarification: Optional[str], output: str, tools: Iterable[str],
+            run_id: Optional[str] = None):
+        """Cache an answer; its TTL follows from the tools its results came from."""
+        key = (normalize(question), normalize(clarification))
+        tools = tuple(sorted(set(tools)))
+        vector = self.embedder.embed(key[0])
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            elif len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            row = self._free_rows.pop() if self._free_rows else self._new_row()
+            self._vectors[row] = vector
+            self._row_keys[row] = key
+            now = time.time()
+            self._entries[key] = CachedAnswer(key[0], key[1], output, tools, now, now + self.ttl(tools), row,
+                                              content_stems(key[0]), run_id)
+
+    def _new_row(self) -> int:
+        # No free row: rows 0..len(entries) - 1 are all in use
+        import numpy as np
+        row = len(self._row_keys)
+        if self._vectors is None or row == len(self._vectors):
+            grown = np.zeros((min(self.max_entries, max(64, 2 * row)), self.embedder.dimensions), dtype=np.float32)
+            if row:
+                grown[:row] = self._vectors
+            self._vectors = grown
+        return row
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key)
+        self._vectors[entry.row] = 0.0
+        del self._row_keys[entry.row]
+        self._free_rows.append(entry.row)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_duplicate_hits": self.near_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            }
+
+
+# Shared by the agents of a process (service workers, batch threads) unless they are given their own
+default_answer_cache = AnswerCache()
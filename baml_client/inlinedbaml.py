@@ -22,7 +22,7 @@ file_map = {
     "critique_answer.baml": "// CritiqueAnswer: Verify the answer's quality and identify missing information if any\nclass Critique {\n  is_good bool\n  missing_info string\n}\n\nfunction CritiqueAnswer(question: string, answer: string) -> Critique {\n  client Gemini2FlashClient\n\n  prompt #\"\"\"\n    You are a critical evaluator of the assistant's answer.\n    Evaluate the answer against the question:\n    - If the answer is fully correct, addresses all parts of the question, and is sufficiently detailed, set is_good to true and missing_info to \"\".\n    - If something is missing, incorrect, or not thoroughly answered, set is_good to false and provide missing_info: a short phrase indicating what info is missing or needs correction (suitable for a search query). Do NOT write a full sentence, just keywords or a brief topic.\n\n    Question: \"{{ question }}\"\n    Answer: \"{{ answer }}\"\n    \n    {{ ctx.output_format }}\n  \"\"\"#\n}\n\n// Tests for CritiqueAnswer\ntest critique_complete_answer {\n  functions [CritiqueAnswer]\n  args { \n    question \"What is 2+2?\", \n    answer \"2+2 is 4.\" \n  }\n  @@assert({{ this.is_good == true }})\n  @@assert({{ this.missing_info == \"\" }})\n}\n\ntest critique_incomplete_answer {\n  functions [CritiqueAnswer]\n  args { \n    question \"What are the benefits and risks of Bitcoin?\", \n    answer \"Bitcoin's benefits include decentralization and fast transactions.\" \n  }\n  // The answer did not cover risks, expect critique to flag missing info about risks\n  @@assert({{ this.is_good == false }})\n  @@assert({{ \"risk\" in this.missing_info | lower() }})\n}\n\ntest critique_incomplete_general_answer {\n  functions [CritiqueAnswer]\n  args { \n    question \"Describe the water cycle, including evaporation and precipitation.\", \n    answer \"The water cycle involves water evaporating from the surface due to heat.\" \n  }\n  // The answer only mentioned evaporation, not precipitation. Expect critique to flag missing info about precipitation.\n  @@assert({{ this.is_good == false }})\n  @@assert({{ \"precipitation\" in this.missing_info | lower() or \"rainfall\" in this.missing_info | lower() }})\n}\n",
     "generate_subqueries.baml": "// GenerateSubqueries: Create multiple search queries based on the question (and clarification if provided)\nfunction GenerateSubqueries(question: string, clarification_details: string) -> string[] {\n  client Gemini2FlashClient\n\n  prompt #\"\"\"\n    You are a query generation assistant. Create 2 to 5 diverse search queries to find information for answering the question.\n    If additional clarification is provided, incorporate that detail.\n    Make each query concise and focused on an aspect of the question.\n    \n    Question: \"{{ question }}\"\n    {% if clarification_details %}\n    Additional detail: \"{{ clarification_details }}\"\n    {% endif %}\n    \n    {{ ctx.output_format }}\n  \"\"\"#\n}\n\n// Tests for GenerateSubqueries\ntest generate_subqueries_basic {\n  functions [GenerateSubqueries]\n  args { question \"What is blockchain technology used for?\", clarification_details \"\" }\n  // Expect at least 2 subqueries returned\n  @@assert({{ this|length >= 2 }})\n  @@assert({{ this[0]|regex_match(\".*\") }})\n}\n\ntest generate_subqueries_with_clarification {\n  functions [GenerateSubqueries]\n  args { \n    question \"Tell me about the history of computers.\", \n    clarification_details \"Focus on the development of personal computers in the 1980s.\" \n  }\n  // Expect queries specifically about 1980s personal computers\n  @@assert({{ this|length >= 2 }})\n  @@assert({{ \n      (this[0] + \" \" + this[1] + \" \" + (this[2] if this|length > 2 else \"\"))\n      |regex_match(\"(?i)(personal computer|1980s|home computer)\") \n  }})\n}\n",
     "generators.baml": "// This helps use auto generate libraries you can use in the language of\n// your choice. You can have multiple generators if you use multiple languages.\n// Just ensure that the output_dir is different for each generator.\ngenerator target {\n    // Valid values: \"python/pydantic\", \"typescript\", \"ruby/sorbet\", \"rest/openapi\"\n    output_type \"python/pydantic\"\n\n    // Where the generated code will be saved (relative to baml_src/)\n    output_dir \"../\"\n\n    // The version of the BAML package you have installed (e.g. same version as your baml-py or @boundaryml/baml).\n    // The BAML VSCode extension version should also match this version.\n    version \"0.81.3\"\n\n    // Valid values: \"sync\", \"async\"\n    // This controls what `b.FunctionName()` will be (sync or async).\n    default_client_mode sync\n}\n",
-    "plan_steps.baml": "// PlanSteps: Decide which tools and steps are needed to answer the question\nenum Tool {\n  WebSearch \n  PriceLookup\n}\n\nclass Step {\n  tool Tool\n  query string\n}\n\nclass Plan {\n  steps Step[]\n}\n\nfunction PlanSteps(question: string, subqueries: string[]) -> Plan {\n  client Gemini2FlashClient\n\n  prompt #\"\"\"\n    You are a planning assistant with access to the following tools:\n    - WebSearch: use this to search the web for general information.\n    - PriceLookup: use this to get the current price of a specific item (e.g., a stock ticker, a known commodity, a cryptocurrency). Check if the query seems to be asking for a specific item's price.\n    \n    Given the user question and potential subqueries, create a step-by-step plan using these tools to gather information.\n    - If the question explicitly asks for a current price or price-related info of a specific, named item, consider using a PriceLookup step for that item.\n    - For other informational needs, use one or more WebSearch steps (one per subquery or topic aspect).\n    - Use at most 5 steps in total. Include only relevant steps.\n    \n    User Question: \"{{ question }}\"\n    Candidate Subqueries:\n    {% for q in subqueries %}\n    - {{ q }}\n    {% endfor %}\n    \n    ----\n    {{ ctx.output_format }}\n  \"\"\"#\n}\n\n// Tests for PlanSteps\ntest plan_steps_general_info_question {\n  functions [PlanSteps]\n  args { \n    question \"What is the main function of the mitochondria?\", \n    subqueries [\"mitochondria function\", \"cellular respiration\"] \n  }\n  // Expect only WebSearch steps (no PriceLookup needed)\n  @@assert({{ (this.steps|selectattr('tool', 'equalto', Tool.PriceLookup)|list)|length == 0 }})\n  @@assert({{ this.steps | length >= 1 }})\n}\n\ntest plan_steps_potential_price_question {\n  functions [PlanSteps]\n  args { \n    question \"What is the current price of GOOGL stock?\", // Example price query\n    subqueries [\"GOOGL stock price\"] \n  }\n  // Expect a PriceLookup step (even if the tool might not support it yet, the plan should reflect intent)\n  @@assert({{ (this.steps|selectattr('tool', 'equalto', Tool.PriceLookup)|list)|length > 0 }})\n}\n\ntest plan_steps_crypto_price_still_works {\n  functions [PlanSteps]\n  args { \n    question \"What is the current price of Bitcoin?\", \n    subqueries [\"Bitcoin price\"] \n  }\n  // Expect a PriceLookup step for Bitcoin (ensure original functionality retained)\n  @@assert({{ (this.steps|selectattr('tool', 'equalto', Tool.PriceLookup)|list)|length > 0 }})\n}\n",
+    "plan_steps.baml": "// PlanSteps: Decide which tools and steps are needed to answer the question\nenum Tool {\n  WebSearch \n  PriceLookup\n  LocalDocs\n}\n\nclass Step {\n  tool Tool\n  query string\n}\n\nclass Plan {\n  steps Step[]\n}\n\nfunction PlanSteps(question: string, subqueries: string[]) -> Plan {\n  client Gemini2FlashClient\n\n  prompt #\"\"\"\n    You are a planning assistant with access to the following tools:\n    - WebSearch: use this to search the web for general information.\n    - PriceLookup: use this to get the current price of a specific item (e.g., a stock ticker, a known commodity, a cryptocurrency). Check if the query seems to be asking for a specific item's price.\n    - LocalDocs: use this to search our internal document collection (handbooks, design documents, reports, meeting notes). Use it for questions about our own projects, teams, processes or documents.\n    \n    Given the user question and potential subqueries, create a step-by-step plan using these tools to gather information.\n    - If the question explicitly asks for a current price or price-related info of a specific, named item, consider using a PriceLookup step for that item.\n    - If the question is about our own organization, projects or internal documents, use LocalDocs steps (combine them with WebSearch steps when public information helps too).\n    - For other informational needs, use one or more WebSearch steps (one per subquery or topic aspect).\n    - Use at most 5 steps in total. Include only relevant steps.\n    \n    User Question: \"{{ question }}\"\n    Candidate Subqueries:\n    {% for q in subqueries %}\n    - {{ q }}\n    {% endfor %}\n    \n    ----\n    {{ ctx.output_format }}\n  \"\"\"#\n}\n\n// Tests for PlanSteps\ntest plan_steps_general_info_question {\n  functions [PlanSteps]\n  args { \n    question \"What is the main function of the mitochondria?\", \n    subqueries [\"mitochondria function\", \"cellular respiration\"] \n  }\n  // Expect only WebSearch steps (no PriceLookup needed)\n  @@assert({{ (this.steps|selectattr('tool', 'equalto', Tool.PriceLookup)|list)|length == 0 }})\n  @@assert({{ this.steps | length >= 1 }})\n}\n\ntest plan_steps_potential_price_question {\n  functions [PlanSteps]\n  args { \n    question \"What is the current price of GOOGL stock?\", // Example price query\n    subqueries [\"GOOGL stock price\"] \n  }\n  // Expect a PriceLookup step (even if the tool might not support it yet, the plan should reflect intent)\n  @@assert({{ (this.steps|selectattr('tool', 'equalto', Tool.PriceLookup)|list)|length > 0 }})\n}\n\ntest plan_steps_crypto_price_still_works {\n  functions [PlanSteps]\n  args { \n    question \"What is the current price of Bitcoin?\", \n    subqueries [\"Bitcoin price\"] \n  }\n  // Expect a PriceLookup step for Bitcoin (ensure original functionality retained)\n  @@assert({{ (this.steps|selectattr('tool', 'equalto', Tool.PriceLookup)|list)|length > 0 }})\n}\n\ntest plan_steps_internal_docs_question {\n  functions [PlanSteps]\n  args { \n    question \"What does our onboarding handbook say about on-call rotations?\", \n    subqueries [\"onboarding handbook on-call rotation\"] \n  }\n  // Expect a LocalDocs step for a question about internal documents\n  @@assert({{ (this.steps|selectattr('tool', 'equalto', Tool.LocalDocs)|list)|length > 0 }})\n}\n",
     "rank_results.baml": "// baml_src/rank_results.baml\n\n// Define the structure of a single search result item\nclass ResultItem {\n  content string?\n  link string?\n}\n\n// Define the structure for a result with its relevance score\nclass RankedResultItem {\n  content string?\n  link string?\n  relevance_score int @description(\"Relevance score from 0 (not relevant) to 10 (highly relevant)\")\n}\n\n// Define the function to score and rank results\nfunction RankResults(\n  question: string,\n  subqueries: string[], // Provides context on why results were fetched\n  results: ResultItem[], // The raw results to be ranked\n  top_k: int // Number of top results to return\n) -> RankedResultItem[] { // Returns the top_k scored and ranked results\n\n  client Gemini2FlashClient // Or your preferred LLM client\n\n  prompt #\"\nAnalyze the following search results based on their relevance and usefulness for answering the main question: \"{{question}}\".\nThe results were gathered based on these subqueries:\n{% for sq in subqueries %}- {{ sq }}\n{% endfor %}\n\nConsider how well each result addresses the core intent of the question and subqueries.\n\nFor EACH result provided below, assign a relevance_score between 0 (not relevant) and 10 (highly relevant).\n\nThen, return ONLY the top {{ top_k }} results, ordered from highest relevance_score to lowest.\nDo not include results with a score below 3 (or adjust threshold if needed).\nDo not add explanations or commentary outside the structured output.\nMaintain the original content and link for each result you return, and include the assigned relevance_score.\n\nResults to score and rank:\n{% for item in results %}{% if item.content %}\nResult Index: {{ loop.index0 }}\nContent: {{ item.content }}\n{% if item.link %}Link: {{ item.link }}{% endif %}\n\n{% endif %}{% endfor %}\n\nOutput ONLY the ranked list of the top {{ top_k }} relevant results (score >= 3) in the specified BAML class format (list<RankedResultItem>).\nExample output format for top_k=2:\n[\n  {\n    content: \"Highly relevant content snippet 1...\",\n    link: \"http://example.com/link1\",\n    relevance_score: 9\n  },\n  {\n    content: \"Moderately relevant content snippet 2 (no link)...\",\n    link: null,\n    relevance_score: 7\n  }\n]\n\n{{ ctx.output_format }}\n\"#\n}\n\n// Optional: Add a test case\ntest TestRankResultsGeneral {\n  functions [RankResults]\n  args {\n    question \"What are the benefits of renewable energy sources?\"\n    top_k 3\n    subqueries [\"advantages of solar power\", \"benefits of wind energy\", \"renewable energy vs fossil fuels\"]\n    results [\n      {\n        content \"Solar power significantly reduces electricity bills and carbon footprint.\",\n        link \"http://example.com/solar-benefits\"\n      },\n      {\n        content \"Wind turbines can be noisy and impact bird populations.\",\n        link \"http://example.com/wind-drawbacks\"\n      },\n      {\n        content \"Fossil fuels are a major contributor to climate change.\",\n        link \"http://example.com/fossil-fuel-impacts\"\n      },\n      {\n        content \"Renewable energy sources like wind and solar offer long-term sustainability.\",\n        link \"http://example.com/renewable-sustainability\"\n      },\n       {\n        content \"Geothermal energy provides a constant power supply.\",\n        link \"http://example.com/geothermal-info\"\n      },\n      {\n        content \"The process of installing solar panels on a home.\",\n        link \"http://example.com/solar-installation\"\n      }\n    ]\n  }\n  // Assert that we get the requested number of results (top_k)\n  @@assert({{ this|length == 3 }})\n  // Assert that the top result has a high score (e.g., >= 7)\n  @@assert({{ this[0].relevance_score >= 7 }})\n  // Assert that the last result returned still has a reasonable score (e.g., >= 3)\n  @@assert({{ this[-1].relevance_score >= 3 }})\n} ",
 }
 
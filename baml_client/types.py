@@ -44,6 +44,7 @@ class Tool(str, Enum):
     
     WebSearch = "WebSearch"
     PriceLookup = "PriceLookup"
+    LocalDocs = "LocalDocs"
 
 class Answer(BaseModel):
     cited_answer: str
@@ -0,0 +1,118 @@
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from agent import DeepResearchAgent, get_agent_graph
+from scheduler import run_priority
+from tools import search_cache, price_cache
+
+
+def read_questions(path: str):
+    """Yield {'id', 'question', 'clarification'} records from a JSONL or CSV file.
+
+    Records without an id get their position in the file (starting at 1) as id.
+    The clarification answer may be given as 'clarification' or 'clarification_answer'.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for position, row in enumerate(rows, start=1):
+            question = (row.get("question") or "").strip()
+            if not question:
+                continue
+            yield {
+                "id": str(row.get("id") or position),
+                "question": question,
+                "clarification": row.get("clarification") or row.get("clarification_answer") or None,
+            }
+
+
+def completed_ids(output_path: str, retry_errors: bool = True):
+    """Ids already answered in the output file; the output file doubles as the resume checkpoint."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by a crash
+            if record.get("error") and retry_errors:
+                done.discard(record.get("id"))
+            else:
+                done.add(record.get("id"))
+    return done
+
+
+def run_batch(agent: DeepResearchAgent, questions, output_path: str, concurrency: int = 4, retry_errors: bool = True):
+    """Answer `questions` with at most `concurrency` runs in flight, appending each result to
+    `output_path` as soon as it completes. Questions already in the output are skipped."""
+    done = completed_ids(output_path, retry_errors)
+    write_lock = threading.Lock()
+    summary = {"answered": 0, "failed": 0, "skipped": 0}
+
+    def answer(record):
+        started = time.perf_counter()
+        result = {"id": record["id"], "question": record["question"]}
+        try:
+            # Batch runs yield LLM and tool calls to interactive runs sharing the process
+            with run_priority("batch"):
+                result["answer"] = agent.run(record["question"], clarification_answer=record["clarification"])
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        def write(result):
+            with write_lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+            summary["failed" if "error" in result else "answered"] += 1
+            print(f"[{result['id']}] {'failed: ' + result['error'] if 'error' in result else 'done'} ({result['seconds']}s)")
+
+        in_flight = set()
+        for record in questions:
+            if record["id"] in done:
+                summary["skipped"] += 1
+                continue
+            # Keep the number of queued questions bounded so huge inputs are streamed, not loaded
+            if len(in_flight) >= 2 * concurrency:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    write(future.result())
+            in_flight.add(executor.submit(answer, record))
+        for future in wait(in_flight).done:
+            write(future.result())
+
+    summary["search_cache"] = {"hits": search_cache.hits, "misses": search_cache.misses}
+    summary["price_cache"] = {"hits": price_cache.hits, "misses": price_cache.misses}
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a batch of questions with the Deep Research Agent")
+    parser.add_argument("input", help="JSONL or CSV file with 'question' and optional 'id' and 'clarification' fields")
+    parser.add_argument("output", help="JSONL file the answers are appended to (also used to resume)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of questions researched in parallel")
+    parser.add_argument("--time-budget", type=float, help="Wall-clock budget per question in seconds")
+    parser.add_argument("--no-retry-errors", action="store_true", help="On resume, do not retry questions that failed")
+    args = parser.parse_args()
+
+    # Batch runs never pause for clarification, so they do not need (or accumulate) checkpoints
+    agent = DeepResearchAgent(get_agent_graph(False), time_budget=args.time_budget, interactive=False)
+    summary = run_batch(
+        agent,
+        read_questions(args.input),
+        args.output,
+        concurrency=args.concurrency,
+        retry_errors=not args.no_retry_errors,
+    )
+    print(json.dumps(summary, indent=2))
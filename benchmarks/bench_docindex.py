@@ -0,0 +1,68 @@
+"""LocalDocs index cost: ingestion time, incremental re-ingestion of a few changed files, and BM25
+lookup latency on a synthetic document collection (Zipf-distributed vocabulary).
+
+Run from the repository root: python benchmarks/bench_docindex.py [--files 2000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docindex import DocIndex  # noqa: E402
+
+VOCABULARY = [f"term{i}" for i in range(20000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def write_document(path: str, rng: random.Random, paragraphs: int = 8, words: int = 60):
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(paragraphs):
+            f.write(" ".join(rng.choices(VOCABULARY, WEIGHTS, k=words)) + "\n\n")
+
+
+def main(files: int, queries: int):
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as root:
+        docs, index_path = os.path.join(root, "docs"), os.path.join(root, "index")
+        os.makedirs(docs)
+        for number in range(files):
+            write_document(os.path.join(docs, f"doc{number}.md"), rng)
+
+        index = DocIndex(index_path)
+        started = time.perf_counter()
+        stats = index.ingest([docs])
+        print(f"ingest {files} files ({stats['passages']} passages): {time.perf_counter() - started:.2f}s")
+
+        for number in rng.sample(range(files), 10):
+            write_document(os.path.join(docs, f"doc{number}.md"), rng)
+        started = time.perf_counter()
+        index.ingest([docs])
+        print(f"re-ingest 10 changed files:     {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        latencies = []
+        for _ in range(queries):
+            query = " ".join(rng.choices(VOCABULARY[50:5000], k=4))
+            started = time.perf_counter()
+            index.search(query, 5)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        print(f"lookup p50 / p95:               {statistics.median(latencies) * 1000:.2f} / "
+              f"{latencies[int(0.95 * (len(latencies) - 1))] * 1000:.2f} ms ({len(index.segments)} segments)")
+        index.compact()
+        started = time.perf_counter()
+        for _ in range(queries):
+            index.search(" ".join(rng.choices(VOCABULARY[50:5000], k=4)), 5)
+        print(f"lookup mean after compact:      {(time.perf_counter() - started) / queries * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000, help="Documents in the synthetic collection")
+    parser.add_argument("--queries", type=int, default=200, help="Lookups measured")
+    args = parser.parse_args()
+    main(args.files, args.queries)
@@ -0,0 +1,83 @@
+"""Cold-start cost of the agent: `import agent` and the latency of the first answer in a fresh
+process, and in workers forked after a prefork.warmup(), with the LLM, search and price backends
+stubbed out (no network, no API keys).
+
+Run from the repository root: python benchmarks/bench_startup.py [--runs 5] [--workers 4]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Shared by both measurements below: one research run on the stub backends from stubs.py
+SHARED = r"""
+def answer(agent, question="Why did the Roman Empire fall?"):
+    from stubs import install_stub_backends
+    install_stub_backends(agent)
+    # Without the research memory, so every run does the same work
+    agent.DeepResearchAgent(agent.get_agent_graph("memory"), interactive=False, use_memory=False,
+                             answer_cache=None).run(question)
+"""
+
+# Executed in a fresh interpreter per measurement
+CHILD = SHARED + r"""
+import json, time
+started = time.perf_counter()
+import agent
+imported = time.perf_counter()
+answer(agent)
+first = time.perf_counter()
+answer(agent, "What caused the decline of the Roman economy?")
+second = time.perf_counter()
+print(json.dumps({"import": imported - started, "first_answer": first - started, "warm_answer": second - first}))
+"""
+
+# Warm up, fork the workers and report each worker's time from fork to its first answer
+PREFORK_CHILD = SHARED + r"""
+import json, os, sys, time
+import prefork
+read_end, write_end = os.pipe()
+
+def worker(index):
+    started = time.perf_counter()
+    import agent
+    answer(agent)
+    os.write(write_end, (json.dumps(time.perf_counter() - started) + "\n").encode())
+
+prefork.run_workers(int(sys.argv[1]), worker)
+os.close(write_end)
+with os.fdopen(read_end) as timings:
+    print(json.dumps([json.loads(line) for line in timings]))
+"""
+
+
+def run_child(code: str, *args):
+    output = subprocess.run([sys.executable, "-c", code, *args], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def measure(runs: int):
+    samples = [run_child(CHILD) for _ in range(runs)]
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+
+def measure_prefork(runs: int, workers: int) -> float:
+    """Median time from fork to first answer of workers started by prefork.run_workers()."""
+    return statistics.median(seconds for _ in range(runs) for seconds in run_child(PREFORK_CHILD, str(workers)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes measured (the median is reported)")
+    parser.add_argument("--workers", type=int, default=4, help="Workers forked per pre-fork measurement")
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    print(f"import agent:            {result['import'] * 1000:7.0f} ms")
+    print(f"first answer (cold):     {result['first_answer'] * 1000:7.0f} ms  (from interpreter start, incl. import)")
+    print(f"next answer (warm):      {result['warm_answer'] * 1000:7.0f} ms")
+    print(f"pre-forked worker:       {measure_prefork(args.runs, args.workers) * 1000:7.0f} ms  (fork to first answer)")
@@ -0,0 +1,85 @@
+"""Memory and validation cost of the agent state: result dicts kept for the whole run (before) vs
+slotted ResultRecords with the raw results pruned after ranking (after).
+
+Run from the repository root: python benchmarks/bench_state.py [--runs 1000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import AgentState  # noqa: E402
+from results import ResultRecord  # noqa: E402
+
+
+class DictState(AgentState):
+    """The state as it was before: results as dicts, raw results kept after ranking."""
+    raw_results: List[Dict[str, Optional[str]]] = []
+    relevant_results: List[Dict[str, Any]] = []
+
+
+def tool_results(run: int, steps: int = 5, per_step: int = 5, content_chars: int = 400):
+    """Result dicts as returned by the tools; runs share some popular links, as real runs do."""
+    results = []
+    for step in range(steps):
+        query = f"subquery {step} of question {run % 50}"
+        for i in range(per_step):
+            link = f"https://example.com/{(run * 7 + step * per_step + i) % 400}/article"
+            content = f"{run}-{step}-{i} " + "lorem ipsum " * (content_chars // 12)
+            results.append({"content": content, "link": link, "query": query})
+    return results
+
+
+def dict_run_values(run: int, top_k: int = 5):
+    raw = tool_results(run)
+    relevant = [{**res, "relevance_score": 8} for res in raw[:top_k]]
+    return {"question": f"question {run}", "raw_results": raw, "relevant_results": relevant}
+
+
+def record_run_values(run: int, top_k: int = 5):
+    raw = [ResultRecord(**res) for res in tool_results(run)]
+    relevant = [r.scored(8) for r in raw[:top_k]]
+    return {"question": f"question {run}", "raw_results": [], "relevant_results": relevant}
+
+
+def state_memory(make_values, state_class, runs: int) -> float:
+    """Bytes per run held by `runs` final states."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    states = [state_class(**make_values(run)) for run in range(runs)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del states
+    return size / runs
+
+
+def validation_seconds(values, state_class, repeat: int) -> float:
+    """Seconds per state construction, which LangGraph does for every node it runs."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        state_class(**values)
+    return (time.perf_counter() - started) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=1000, help="Number of run states held in memory")
+    parser.add_argument("--repeat", type=int, default=2000, help="State constructions timed per variant")
+    args = parser.parse_args()
+
+    dict_bytes = state_memory(dict_run_values, DictState, args.runs)
+    record_bytes = state_memory(record_run_values, AgentState, args.runs)
+    # Per-node validation while the raw results are still in the state (gather -> filter)
+    dict_seconds = validation_seconds(dict_run_values(0), DictState, args.repeat)
+    raw_records = {**record_run_values(0), "raw_results": [ResultRecord(**r) for r in tool_results(0)]}
+    record_seconds = validation_seconds(raw_records, AgentState, args.repeat)
+
+    print(f"memory per run:        dicts {dict_bytes / 1024:8.1f} KiB   records {record_bytes / 1024:8.1f} KiB"
+          f"   ({1 - record_bytes / dict_bytes:.0%} less)")
+    print(f"validation per node:   dicts {dict_seconds * 1e6:8.1f} us    records {record_seconds * 1e6:8.1f} us"
+          f"    ({dict_seconds / record_seconds:.1f}x faster)")
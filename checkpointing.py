@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import zlib
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+# Where research runs are checkpointed unless another location is configured
+DEFAULT_CHECKPOINT_PATH = os.environ.get("HEKMATICA_CHECKPOINT_DB", "checkpoints.sqlite")
+
+# Serialized values above this size (bytes) are zlib-compressed before they are written
+COMPRESS_MIN_BYTES = 512
+
+
+class CompactSerializer(JsonPlusSerializer):
+    """msgpack serialization of the checkpointed state, zlib-compressed for larger values
+    (search results and answers compress well)."""
+
+    def dumps_typed(self, obj):
+        type_, data = super().dumps_typed(obj)
+        if len(data) >= COMPRESS_MIN_BYTES:
+            return f"zlib+{type_}", zlib.compress(data, 6)
+        return type_, data
+
+    def loads_typed(self, data):
+        type_, payload = data
+        if type_.startswith("zlib+"):
+            return super().loads_typed((type_[len("zlib+"):], zlib.decompress(payload)))
+        return super().loads_typed(data)
+
+
+def make_checkpointer(spec: str = None):
+    """Create a checkpointer from a spec: "memory", "sqlite:<path>" or a plain SQLite file path.
+
+    Defaults to the SQLite database at DEFAULT_CHECKPOINT_PATH.
+    """
+    spec = spec or DEFAULT_CHECKPOINT_PATH
+    if spec == "memory":
+        return MemorySaver(serde=CompactSerializer())
+    path = spec[len("sqlite:"):] if spec.startswith("sqlite:") else spec
+    # The agent runs graphs from several threads (batch, service workers); SqliteSaver serializes access itself
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return SqliteSaver(conn, serde=CompactSerializer())
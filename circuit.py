@@ -0,0 +1,97 @@
+import threading
+import time
+from typing import Dict
+
+from metrics import metrics
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}  # value of the circuit.<name>.state gauge
+
+FAILURE_THRESHOLD = 3  # consecutive failures that open a circuit
+RESET_TIMEOUT = 30.0  # seconds an open circuit short-circuits calls before letting a probe through
+
+
+class CircuitBreaker:
+    """Circuit breaker for one upstream endpoint (thread-safe).
+
+    Closed: calls go through; FAILURE_THRESHOLD failures in a row open the circuit. Open: calls are
+    refused at once (allow() is False) for `reset_timeout` seconds. Half-open: one probe call goes
+    through; its success closes the circuit, its failure opens it again. A probe that never reports
+    (the caller gave up before calling) is replaced after another `reset_timeout`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+        metrics.set_gauge(f"circuit.{name}.state", STATE_CODES[CLOSED])
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            metrics.set_gauge(f"circuit.{self.name}.state", STATE_CODES[state])
+            metrics.incr(f"circuit.{self.name}.{state}")
+
+    def allow(self) -> bool:
+        """Whether a call may go to the endpoint now."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+                self._probe_started = None
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and (self._probe_started is None or now - self._probe_started >= self.reset_timeout):
+                self._probe_started = now
+                return True
+        metrics.incr(f"circuit.{self.name}.short_circuited")
+        return False
+
+    def available(self) -> bool:
+        """Whether allow() would let a call through now (no probe is taken, unlike allow())."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                return now - self._opened_at >= self.reset_timeout
+            if self.state == HALF_OPEN:
+                # Only one probe at a time: while it is in flight, further calls are refused
+                return self._probe_started is None or now - self._probe_started >= self.reset_timeout
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def summary(self):
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """The process-wide circuit breaker of `endpoint` (created closed on first use)."""
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+def circuit_report():
+    with _breakers_lock:
+        return {name: breaker.summary() for name, breaker in _breakers.items()}
@@ -0,0 +1,378 @@
+import argparse
+import array
+import heapq
+import json
+import math
+import mmap
+import os
+import shutil
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ranking import tokenize
+
+# On-disk index of our own documents behind the LocalDocs tool (HEKMATICA_DOCS_INDEX, default ./docs_index)
+DEFAULT_INDEX_PATH = os.environ.get("HEKMATICA_DOCS_INDEX", "docs_index")
+DOC_SUFFIXES = (".md", ".txt", ".rst")
+CHUNK_WORDS = 120  # paragraphs are merged into passages of about this many words
+SNIPPET_CHARS = 400  # longest passage text returned; longer passages are cut around the first match
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def chunk_text(text: str) -> List[Tuple[int, str]]:
+    """Split a document into passages of about CHUNK_WORDS words along paragraph boundaries.
+
+    Returns (first line number, passage text) pairs.
+    """
+    paragraphs = []  # (first line, words)
+    start, words = None, []
+    for number, line in enumerate(text.splitlines() + [""], start=1):
+        if line.strip():
+            start = start or number
+            words.extend(line.split())
+        elif words:
+            paragraphs.append((start, words))
+            start, words = None, []
+
+    passages = []
+    start, words = None, []
+    for paragraph_start, paragraph_words in paragraphs:
+        if words and len(words) + len(paragraph_words) > CHUNK_WORDS:
+            passages.append((start, " ".join(words)))
+            start, words = None, []
+        start = start or paragraph_start
+        words.extend(paragraph_words)
+    if words:
+        passages.append((start, " ".join(words)))
+    return passages
+
+
+def _write_segment(directory: str, documents: List[Tuple[str, int, str]]):
+    """Write an immutable segment for `documents` ((path, first line, text) passages).
+
+    postings.bin holds every term's posting list as consecutive (passage, term frequency) uint32
+    pairs; text.bin the UTF-8 passage texts; segment.json the term dictionary (term -> first pair,
+    pair count), the file paths and per passage (path index, first line, length in tokens, text
+    offset, text size).
+    """
+    tmp = directory + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    paths, path_ids, docs = [], {}, []
+    postings = defaultdict(list)
+    offset = 0
+    with open(os.path.join(tmp, "text.bin"), "wb") as text_file:
+        for doc_id, (path, line, text) in enumerate(documents):
+            if path not in path_ids:
+                path_ids[path] = len(paths)
+                paths.append(path)
+            tokens = tokenize(text)
+            encoded = text.encode("utf-8")
+            docs.append([path_ids[path], line, len(tokens), offset, len(encoded)])
+            text_file.write(encoded)
+            offset += len(encoded)
+            for term, frequency in Counter(tokens).items():
+                postings[term].extend((doc_id, frequency))
+
+    terms, flat = {}, array.array("I")
+    for term in sorted(postings):
+        terms[term] = [len(flat) // 2, len(postings[term]) // 2]
+        flat.extend(postings[term])
+    with open(os.path.join(tmp, "postings.bin"), "wb") as postings_file:
+        flat.tofile(postings_file)
+    with open(os.path.join(tmp, "segment.json"), "w", encoding="utf-8") as meta_file:
+        json.dump({"paths": paths, "docs": docs, "terms": terms}, meta_file)
+    os.replace(tmp, directory)
+
+
+def _map(file_path: str):
+    """Read-only memory map of a file (None when it is empty: empty files cannot be mapped)."""
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _Segment:
+    """A segment opened for searching. Posting lists and texts stay on disk, memory-mapped, and are
+    paged in by the OS as queries touch them; only the term dictionary is held in memory."""
+
+    def __init__(self, directory: str, deleted: Iterable[int]):
+        with open(os.path.join(directory, "segment.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.paths = meta["paths"]
+        self.docs = meta["docs"]
+        self.terms = meta["terms"]
+        self.deleted = set(deleted)  # passages of files changed or removed since the segment was written
+        postings = _map(os.path.join(directory, "postings.bin"))
+        self.postings = memoryview(postings).cast("I") if postings is not None else memoryview(array.array("I"))
+        self.text_map = _map(os.path.join(directory, "text.bin"))
+        self.live = len(self.docs) - len(self.deleted)
+        self.live_length = sum(doc[2] for doc_id, doc in enumerate(self.docs) if doc_id not in self.deleted)
+
+    def posting_list(self, term: str):
+        entry = self.terms.get(term)
+        if entry is None:
+            return None
+        first, count = entry
+        return self.postings[2 * first:2 * (first + count)]
+
+    def text(self, doc_id: int) -> str:
+        _, _, _, offset, size = self.docs[doc_id]
+        return self.text_map[offset:offset + size].decode("utf-8")
+
+
+def _snippet(text: str, terms) -> str:
+    """The passage, or for long passages SNIPPET_CHARS around the first occurrence of a query term."""
+    if len(text) <= SNIPPET_CHARS:
+        return text
+    lowered = text.lower()
+    first = min((index for index in (lowered.find(term) for term in terms) if index >= 0), default=0)
+    start = max(0, first - SNIPPET_CHARS // 4)
+    if start:
+        start = text.find(" ", start) + 1
+    end = text.rfind(" ", start, start + SNIPPET_CHARS)
+    end = end if end > start else start + SNIPPET_CHARS
+    return ("..." if start else "") + text[start:end] + ("..." if end < len(text) else "")
+
+
+class DocIndex:
+    """Incrementally updatable inverted index over document collections, scored with BM25.
+
+    The index is a directory of immutable segments plus manifest.json. Each ingest() writes one new
+    segment with the new and changed files. Passages of changed or removed files are only marked
+    deleted in their old segment, so updates cost time proportional to what changed. compact()
+    rewrites the live passages into a single segment. Readers reload when the manifest changes.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        self._manifest_mtime = None
+        self._load()
+
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.path, "manifest.json")
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"segments": {}, "next_segment": 1, "files": {}}
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._manifest_path)
+
+    def _load(self):
+        manifest = self._read_manifest()
+        try:
+            self._manifest_mtime = os.stat(self._manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            self._manifest_mtime = None
+        segments = []
+        for name, info in manifest["segments"].items():
+            deleted = (doc_id for first, count in info["deleted"] for doc_id in range(first, first + count))
+            segments.append(_Segment(os.path.join(self.path, name), deleted))
+        self.segments = segments
+        self.passages = sum(segment.live for segment in segments)
+        self.files = len(manifest["files"])
+        self.average_length = sum(segment.live_length for segment in segments) / self.passages if self.passages else 0.0
+
+    def refresh(self):
+        """Reload if another process (the ingestion CLI) has updated the index since it was loaded."""
+        try:
+            mtime = os.stat(self._manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._manifest_mtime:
+            self._load()
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict]:
+        """The best `max_results` passages for `query` by BM25, best first.
+
+        Each hit has the passage snippet as "content", "path:line" citation as "link", its "score"
+        and the number of distinct query terms it "matched".
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.passages:
+            return []
+        segments = self.segments
+        scores = defaultdict(float)
+        matched = Counter()
+        for term in terms:
+            lists = [(index, segment.posting_list(term)) for index, segment in enumerate(segments)]
+            lists = [(index, postings) for index, postings in lists if postings is not None]
+            document_frequency = sum(len(postings) // 2 for _, postings in lists)
+            if not document_frequency:
+                continue
+            idf = math.log(1 + (self.passages - document_frequency + 0.5) / (document_frequency + 0.5))
+            for index, postings in lists:
+                segment = segments[index]
+                docs, deleted = segment.docs, segment.deleted
+                for position in range(0, len(postings), 2):
+                    doc_id = postings[position]
+                    if doc_id in deleted:
+                        continue
+                    frequency = postings[position + 1]
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * docs[doc_id][2] / self.average_length)
+                    scores[index, doc_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    matched[index, doc_id] += 1
+
+        hits = []
+        for (index, doc_id), score in heapq.nlargest(max_results, scores.items(), key=lambda item: item[1]):
+            segment = segments[index]
+            path_id, line = segment.docs[doc_id][:2]
+            hits.append({
+                "content": _snippet(segment.text(doc_id), terms),
+                "link": f"{segment.paths[path_id]}:{line}",
+                "score": score,
+                "matched": matched[index, doc_id],
+            })
+        return hits
+
+    def ingest(self, paths: Iterable[str], prune: bool = True) -> Dict[str, int]:
+        """Index the documents (DOC_SUFFIXES) in the given files and directories.
+
+        Files unchanged since the last ingest (same size and modification time) are skipped. With
+        `prune`, indexed files under the given directories that no longer exist are removed.
+        """
+        roots = [os.path.abspath(path) for path in paths]
+        files = {}
+        for root in roots:
+            if os.path.isdir(root):
+                for directory, _, names in os.walk(root):
+                    for name in names:
+                        if name.endswith(DOC_SUFFIXES):
+                            file_path = os.path.join(directory, name)
+                            files[file_path] = os.stat(file_path)
+            elif os.path.exists(root):
+                files[root] = os.stat(root)
+
+        manifest = self._read_manifest()
+        indexed = manifest["files"]
+        changed = [path for path, st in files.items()
+                   if path not in indexed or (indexed[path]["mtime"], indexed[path]["size"]) != (st.st_mtime_ns, st.st_size)]
+        removed = [path for path in indexed if path not in files and prune
+                   and any(path == root or path.startswith(root + os.sep) for root in roots)]
+        stats = {"added": sum(1 for path in changed if path not in indexed),
+                 "updated": sum(1 for path in changed if path in indexed), "removed": len(removed), "passages": 0}
+
+        # Mark the old passages of changed and removed files deleted
+        for path in changed + removed:
+            entry = indexed.pop(path, None)
+            if entry and entry["docs"][1]:
+                manifest["segments"][entry["segment"]]["deleted"].append(entry["docs"])
+
+        documents = []
+        name = f"seg-{manifest['next_segment']:06d}"
+        for path in changed:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                passages = chunk_text(f.read())
+            indexed[path] = {"mtime": files[path].st_mtime_ns, "size": files[path].st_size, "segment": name,
+                             "docs": [len(documents), len(passages)]}
+            documents.extend((path, line, text) for line, text in passages)
+        if documents:
+            _write_segment(os.path.join(self.path, name), documents)
+            manifest["segments"][name] = {"passages": len(documents), "deleted": []}
+            manifest["next_segment"] += 1
+            stats["passages"] = len(documents)
+
+        # Segments whose passages are all deleted are dropped
+        dropped = [segment for segment, info in manifest["segments"].items()
+                   if sum(count for _, count in info["deleted"]) >= info["passages"]]
+        for segment in dropped:
+            del manifest["segments"][segment]
+        self._write_manifest(manifest)
+        for segment in dropped:
+            shutil.rmtree(os.path.join(self.path, segment), ignore_errors=True)
+        self._load()
+        return stats
+
+    def compact(self) -> int:
+        """Rewrite all live passages into one segment (drops deleted passages, speeds up lookups).
+
+        Returns the number of passages."""
+        manifest = self._read_manifest()
+        documents, files = [], {}
+        name = f"seg-{manifest['next_segment']:06d}"
+        for segment_name, info in manifest["segments"].items():
+            segment = _Segment(os.path.join(self.path, segment_name),
+                               (doc_id for first, count in info["deleted"] for doc_id in range(first, first + count)))
+            for doc_id, (path_id, line, _, _, _) in enumerate(segment.docs):
+                if doc_id in segment.deleted:
+                    continue
+                path = segment.paths[path_id]
+                entry = manifest["files"][path]
+                if path not in files:
+                    files[path] = {"mtime": entry["mtime"], "size": entry["size"], "segment": name, "docs": [len(documents), 0]}
+                files[path]["docs"][1] += 1
+                documents.append((path, line, segment.text(doc_id)))
+        old_segments = list(manifest["segments"])
+        if documents:
+            _write_segment(os.path.join(self.path, name), documents)
+        manifest = {"segments": {name: {"passages": len(documents), "deleted": []}} if documents else {},
+                    "next_segment": manifest["next_segment"] + 1, "files": files}
+        self._write_manifest(manifest)
+        for segment_name in old_segments:
+            shutil.rmtree(os.path.join(self.path, segment_name), ignore_errors=True)
+        self._load()
+        return len(documents)
+
+    def stats(self):
+        return {"path": self.path, "files": self.files, "passages": self.passages, "segments": len(self.segments),
+                "terms": sum(len(segment.terms) for segment in self.segments)}
+
+
+_index: Optional[DocIndex] = None
+_index_lock = threading.Lock()
+
+
+def doc_index() -> DocIndex:
+    """The process-wide index at DEFAULT_INDEX_PATH, reloaded when the ingestion CLI has changed it."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DocIndex(DEFAULT_INDEX_PATH)
+        else:
+            _index.refresh()
+        return _index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the LocalDocs index")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Index directory (default: HEKMATICA_DOCS_INDEX or docs_index)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Index new and changed documents (.md, .txt, .rst)")
+    ingest_parser.add_argument("paths", nargs="+", help="Files and directories to index")
+    ingest_parser.add_argument("--no-prune", action="store_true", help="Keep indexed files that no longer exist")
+    search_parser = commands.add_parser("search", help="Run a query against the index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-k", type=int, default=5, help="Number of passages to show")
+    commands.add_parser("compact", help="Merge all segments into one, dropping deleted passages")
+    commands.add_parser("stats", help="Show the size of the index")
+    args = parser.parse_args()
+
+    index = DocIndex(args.index)
+    if args.command == "ingest":
+        started = time.perf_counter()
+        stats = index.ingest(args.paths, prune=not args.no_prune)
+        print(f"Indexed {stats['passages']} passages from {stats['added']} new and {stats['updated']} changed files, "
+              f"removed {stats['removed']} files in {time.perf_counter() - started:.2f}s")
+    elif args.command == "search":
+        started = time.perf_counter()
+        hits = index.search(args.query, args.k)
+        elapsed = time.perf_counter() - started
+        for hit in hits:
+            print(f"{hit['score']:6.2f}  {hit['link']}\n        {hit['content']}")
+        print(f"{len(hits)} passages in {elapsed * 1000:.1f} ms")
+    elif args.command == "compact":
+        print(f"Compacted the index into {index.compact()} passages")
+    print(json.dumps(index.stats()))
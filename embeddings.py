@@ -0,0 +1,60 @@
+import math
+import zlib
+from collections import Counter
+from typing import TYPE_CHECKING, Iterable, List
+
+from ranking import tokenize
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DIMENSIONS = 1024  # power of two: the low bits of a feature's hash pick its bucket
+
+# Feature weights: whole words carry the meaning, word pairs the phrasing, and character trigrams
+# match inflections and typos ("rotation" / "rotations") that whole words miss
+UNIGRAM_WEIGHT = 1.0
+BIGRAM_WEIGHT = 0.5
+TRIGRAM_WEIGHT = 0.25
+
+
+class HashingEmbedder:
+    """Local text embeddings without a model or network: signed feature hashing of word unigrams,
+    word bigrams and character trigrams into `dimensions` buckets, dampened and L2-normalized.
+
+    Hashes are CRC32 (stable across processes, unlike hash()), so stored vectors stay valid. The
+    cosine similarity of two embeddings is their dot product.
+    """
+
+    def __init__(self, dimensions: int = DIMENSIONS):
+        self.dimensions = dimensions
+
+    def features(self, text: str) -> Counter:
+        tokens = tokenize(text)
+        features = Counter()
+        for token in tokens:
+            features[token] += UNIGRAM_WEIGHT
+            padded = f"#{token}#"
+            for start in range(len(padded) - 2):
+                features["#" + padded[start:start + 3]] += TRIGRAM_WEIGHT
+        for first, second in zip(tokens, tokens[1:]):
+            features[first + " " + second] += BIGRAM_WEIGHT
+        return features
+
+    def embed(self, text: str) -> "np.ndarray":
+        import numpy as np
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        mask = self.dimensions - 1
+        for feature, weight in self.features(text).items():
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if digest & 0x10000 else -1.0
+            # Square root: repeating a word adds less and less
+            vector[digest & mask] += sign * math.sqrt(weight)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, texts: Iterable[str]) -> "np.ndarray":
+        import numpy as np
+        texts: List[str] = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        return np.stack([self.embed(text) for text in texts])
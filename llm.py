@@ -0,0 +1,427 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from baml_py import ClientRegistry
+
+from baml_client.sync_client import b
+from baml_client.async_client import b as async_b
+from metrics import metrics
+from ratelimit import is_rate_limited, rate_limiter
+from scheduler import PrioritySemaphore
+
+logger = logging.getLogger("LLMRouter")
+
+# Environment variable each client in baml_src/clients.baml needs; clients without a key are never routed to
+CLIENT_API_KEYS = {
+    "Gemini2FlashClient": "GEMINI_API_KEY",
+    "CustomGPT4oMini": "OPENAI_API_KEY",
+    "CustomGPT4o": "OPENAI_API_KEY",
+    "CustomHaiku": "ANTHROPIC_API_KEY",
+    "CustomSonnet": "ANTHROPIC_API_KEY",
+}
+
+# Provider of each client, i.e. the rate limit it counts against (None is the client pinned in baml_src)
+CLIENT_PROVIDERS = {
+    None: "gemini",
+    "Gemini2FlashClient": "gemini",
+    "CustomGPT4oMini": "openai",
+    "CustomGPT4o": "openai",
+    "CustomHaiku": "anthropic",
+    "CustomSonnet": "anthropic",
+}
+
+# Interchangeable clients per quality tier. The first client of a tier is the default
+# used until the others have latency samples.
+QUALITY_TIERS = {
+    "fast": ["Gemini2FlashClient", "CustomGPT4oMini", "CustomHaiku"],
+    "strong": ["CustomGPT4o", "CustomSonnet", "Gemini2FlashClient"],
+}
+
+# Quality tier of every BAML function (all of them are pinned to Gemini2FlashClient in baml_src)
+FUNCTION_TIERS = {
+    "ClarifyQuestion": "fast",
+    "GenerateSubqueries": "fast",
+    "PlanSteps": "fast",
+    "RankResults": "fast",
+    "AnswerQuestion": "fast",
+    "CritiqueAnswer": "fast",
+}
+
+WINDOW_SIZE = 50  # rolling window of calls kept per (function, client)
+MIN_SAMPLES = 3  # samples needed before a client's latency is trusted
+MAX_ERROR_RATE = 0.5  # clients above this error rate are considered unhealthy
+EXPLORE_RATE = 0.05  # probability of trying a random healthy client to keep its statistics fresh
+ROUTING_ENABLED = os.environ.get("HEKMATICA_LLM_ROUTING", "1") != "0"
+
+# Most BAML calls in flight at once across all runs in the process; waiting calls go by run priority
+llm_slots = PrioritySemaphore(int(os.environ.get("HEKMATICA_LLM_CONCURRENCY", "16")))
+
+# Latency assumed for each function (seconds) until this process has observed real calls
+DEFAULT_LATENCY_ESTIMATES = {
+    "ClarifyQuestion": 2.0,
+    "GenerateSubqueries": 2.0,
+    "PlanSteps": 2.0,
+    "RankResults": 4.0,
+    "AnswerQuestion": 6.0,
+    "CritiqueAnswer": 3.0,
+}
+
+
+def _percentile(sorted_values, fraction: float):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class ClientStats:
+    """Rolling latency and error statistics of one client for one function."""
+
+    def __init__(self, window: int = WINDOW_SIZE):
+        self.calls = deque(maxlen=window)  # (latency seconds, ok)
+
+    def record(self, latency: float, ok: bool):
+        self.calls.append((latency, ok))
+
+    @property
+    def samples(self) -> int:
+        return len(self.calls)
+
+    def error_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls)
+
+    def latency(self, fraction: float):
+        latencies = sorted(latency for latency, ok in self.calls if ok)
+        return _percentile(latencies, fraction) if latencies else None
+
+    def summary(self):
+        return {
+            "samples": self.samples,
+            "p50": self.latency(0.5),
+            "p95": self.latency(0.95),
+            "error_rate": self.error_rate(),
+        }
+
+
+class ClientRouter:
+    """Picks the fastest healthy client of a function's quality tier from rolling p95 latency."""
+
+    def __init__(self, tiers=None, function_tiers=None, explore_rate: float = EXPLORE_RATE):
+        self.tiers = tiers or QUALITY_TIERS
+        self.function_tiers = function_tiers or FUNCTION_TIERS
+        self.explore_rate = explore_rate
+        self._lock = threading.Lock()
+        self._stats = {}  # (function, client) -> ClientStats
+        self._clients = {}  # client name -> BAML client bound to a ClientRegistry
+        self._async_clients = {}  # same, for the async BAML client used by hedged calls
+
+    def _stats_for(self, function: str, client: str) -> ClientStats:
+        key = (function, client)
+        if key not in self._stats:
+            self._stats[key] = ClientStats()
+        return self._stats[key]
+
+    def available_clients(self, function: str):
+        tier = self.function_tiers.get(function, "fast")
+        return [client for client in self.tiers[tier] if os.environ.get(CLIENT_API_KEYS.get(client, ""), "")]
+
+    def candidates(self, function: str):
+        """Clients to try for `function`, best first: healthy before unhealthy, then by p95 latency."""
+        clients = self.available_clients(function)
+        if not clients:
+            # No API keys visible to us: let BAML use the client pinned in baml_src
+            return [None]
+        with self._lock:
+            ranked = []
+            for position, client in enumerate(clients):
+                stats = self._stats_for(function, client)
+                healthy = stats.samples < MIN_SAMPLES or stats.error_rate() <= MAX_ERROR_RATE
+                p95 = stats.latency(0.95) if stats.samples >= MIN_SAMPLES else None
+                # Unmeasured clients rank after measured ones, except the tier default
+                latency_key = p95 if p95 is not None else (0.0 if position == 0 else float("inf"))
+                ranked.append((not healthy, latency_key, position, client))
+        ranked.sort()
+        ordered = [client for *_, client in ranked]
+        healthy = [client for unhealthy, *_, client in ranked if not unhealthy]
+        if len(healthy) > 1 and random.random() < self.explore_rate:
+            explored = random.choice(healthy[1:])
+            ordered.remove(explored)
+            ordered.insert(0, explored)
+        return ordered
+
+    def record(self, function: str, client: str, latency: float, ok: bool):
+        metrics.observe(f"llm.{function}.seconds", latency)
+        if not ok:
+            metrics.incr(f"llm.{function}.errors")
+        with self._lock:
+            # Also for the pinned client (None): never ranked, but its window feeds expected_latency()
+            self._stats_for(function, client).record(latency, ok)
+
+    def mean_latency(self, function: str):
+        """Mean latency of the recent successful calls of `function` on any client (rolling windows), or None."""
+        with self._lock:
+            latencies = [latency for (name, _), stats in self._stats.items() if name == function
+                         for latency, ok in stats.calls if ok]
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def latency(self, function: str, client: str, fraction: float):
+        """Rolling latency percentile of `client` for `function`, None until there are enough samples."""
+        with self._lock:
+            stats = self._stats.get((function, client))
+            if stats is None or stats.samples < MIN_SAMPLES:
+                return None
+            return stats.latency(fraction)
+
+    def _bound_client(self, cache, base, name: str):
+        if name is None:
+            return base
+        with self._lock:
+            if name not in cache:
+                registry = ClientRegistry()
+                registry.set_primary(name)
+                cache[name] = base.with_options(client_registry=registry)
+            return cache[name]
+
+    def client(self, name: str):
+        """BAML client whose primary client is `name` (None means the client pinned in baml_src)."""
+        return self._bound_client(self._clients, b, name)
+
+    def async_client(self, name: str):
+        """Async counterpart of `client`, used where calls must be cancellable."""
+        return self._bound_client(self._async_clients, async_b, name)
+
+    def report(self):
+        """Rolling p50/p95 latency and error rate for every (function, client) pair seen so far."""
+        with self._lock:
+            report = {}
+            for (function, client), stats in self._stats.items():
+                report.setdefault(function, {})[client] = stats.summary()
+            return report
+
+
+router = ClientRouter()
+
+
+@dataclass
+class HedgePolicy:
+    """When to send a duplicate of a slow call: after the primary client's `percentile` latency,
+    clamped to [min_delay, max_delay] seconds (`default_delay` until latency samples exist)."""
+    percentile: float = 0.95
+    default_delay: float = 5.0
+    min_delay: float = 0.5
+    max_delay: float = 20.0
+
+
+class HedgeBudget:
+    """Caps hedged (duplicate) calls to `ratio` of all hedge-eligible calls, plus a small burst allowance."""
+
+    def __init__(self, ratio: float = 0.1, burst: int = 3):
+        self.ratio = ratio
+        self.burst = burst
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedges = 0
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.hedges < self.ratio * self.calls + self.burst:
+                self.hedges += 1
+                return True
+            return False
+
+
+# Hedging is opt-in per function, e.g. HEKMATICA_HEDGE="AnswerQuestion,RankResults" or configure_hedging()
+HEDGE_POLICIES = {
+    function.strip(): HedgePolicy()
+    for function in os.environ.get("HEKMATICA_HEDGE", "").split(",") if function.strip()
+}
+hedge_budget = HedgeBudget(ratio=float(os.environ.get("HEKMATICA_HEDGE_BUDGET", "0.1")))
+
+
+def configure_hedging(function: str, policy: HedgePolicy = None):
+    """Enable hedging for `function` with the given policy (defaults to HedgePolicy())."""
+    HEDGE_POLICIES[function] = policy or HedgePolicy()
+
+
+def disable_hedging(function: str):
+    HEDGE_POLICIES.pop(function, None)
+
+
+def _provider_limiter(client: str):
+    return rate_limiter(CLIENT_PROVIDERS.get(client, "gemini"))
+
+
+def _limiter_feedback(function: str, limiter, error: Exception = None):
+    """Tell the provider's rate limiter how a call went: back off on 429s, probe up on success."""
+    if error is None:
+        limiter.succeeded()
+    elif is_rate_limited(error):
+        metrics.incr(f"llm.{function}.rate_limited")
+        limiter.throttled()
+
+
+def _hedge_delay(function: str, client: str, policy: HedgePolicy) -> float:
+    observed = router.latency(function, client, policy.percentile)
+    delay = observed if observed is not None else policy.default_delay
+    return min(policy.max_delay, max(policy.min_delay, delay))
+
+
+async def _timed(function: str, client: str, kwargs):
+    limiter = _provider_limiter(client)
+    await limiter.acquire_async()
+    started = time.perf_counter()
+    try:
+        result = await getattr(router.async_client(client), function)(**kwargs)
+    except asyncio.CancelledError:
+        # The losing side of a hedge (or a caller timeout): it never finished, so it is
+        # neither a success nor a failure of this client and is left out of its stats
+        raise
+    except Exception as e:
+        router.record(function, client, time.perf_counter() - started, ok=False)
+        _limiter_feedback(function, limiter, e)
+        raise
+    router.record(function, client, time.perf_counter() - started, ok=True)
+    _limiter_feedback(function, limiter)
+    return result
+
+
+async def _hedged_call(function: str, primary: str, secondary: str, policy: HedgePolicy, kwargs, tried: list):
+    """Run `function` on `primary`; if it is slower than the hedge delay, race a duplicate on `secondary`.
+    The first successful result wins and the other call is cancelled. The clients actually called are
+    appended to `tried`, so that a failed call fails over to the others."""
+    tried.append(primary)
+    first = asyncio.ensure_future(_timed(function, primary, kwargs))
+    done, _ = await asyncio.wait({first}, timeout=_hedge_delay(function, primary, policy))
+    if done or not hedge_budget.try_acquire():
+        return await first
+
+    metrics.incr(f"llm.{function}.hedged")
+    tried.append(secondary)
+    second = asyncio.ensure_future(_timed(function, secondary, kwargs))
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for loser in pending:
+                    loser.cancel()
+                if task is second:
+                    metrics.incr(f"llm.{function}.hedge_wins")
+                return task.result()
+            error = error or task.exception()
+    raise error
+
+
+async def _call_with_failover(function: str, candidates, kwargs):
+    """Async counterpart of the failover loop in _call_llm (hedging first when enabled), so a caller's
+    timeout bounds all the attempts together."""
+    last_error = None
+    policy = HEDGE_POLICIES.get(function)
+    if policy:
+        hedge_budget.record_call()
+        primary = candidates[0]
+        secondary = candidates[1] if len(candidates) > 1 else primary
+        tried = []
+        try:
+            return await _hedged_call(function, primary, secondary, policy, kwargs, tried)
+        except Exception as e:
+            logger.warning(f"Hedged {function} failed on {primary or 'default client'}: {e}")
+            last_error = e
+            candidates = [client for client in candidates if client not in tried]
+    for client in candidates:
+        try:
+            return await _timed(function, client, kwargs)
+        except Exception as e:
+            logger.warning(f"{function} failed on {client or 'default client'}: {e}")
+            last_error = e
+    raise last_error
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def expected_latency(function: str) -> float:
+    """Expected duration of a call to `function`: the mean of its recent calls, or the default estimate."""
+    observed = router.mean_latency(function)
+    return observed if observed is not None else DEFAULT_LATENCY_ESTIMATES.get(function, 5.0)
+
+
+def call_llm(function: str, timeout: float = None, **kwargs):
+    """Call the BAML function `function` through the router, failing over to the next client on errors.
+
+    The call waits for one of the `llm_slots`. With a `timeout` (seconds) the call is cancelled and
+    TimeoutError raised once it runs out, including the time spent waiting for a slot.
+    """
+    started = time.monotonic()
+    if not llm_slots.acquire(timeout):
+        metrics.incr(f"llm.{function}.timeouts")
+        raise TimeoutError(f"No LLM slot became free for {function} within {timeout:.1f}s")
+    waited = time.monotonic() - started
+    metrics.observe("llm.slot_wait_seconds", waited)
+    try:
+        return _call_llm(function, None if timeout is None else timeout - waited, **kwargs)
+    finally:
+        llm_slots.release()
+
+
+def _call_llm(function: str, timeout: float = None, **kwargs):
+    candidates = router.candidates(function) if ROUTING_ENABLED else [None]
+    last_error = None
+
+    if timeout is not None and not _in_event_loop():
+        if timeout <= 0:
+            raise TimeoutError(f"No time left to call {function}")
+        try:
+            # Fails over to the next clients as long as the time lasts
+            return asyncio.run(asyncio.wait_for(_call_with_failover(function, candidates, kwargs), timeout))
+        except asyncio.TimeoutError:
+            metrics.incr(f"llm.{function}.timeouts")
+            raise TimeoutError(f"{function} did not finish within {timeout:.1f}s") from None
+
+    policy = HEDGE_POLICIES.get(function)
+    if policy and not _in_event_loop():
+        hedge_budget.record_call()
+        primary = candidates[0]
+        # Hedge to the next client when there is one, otherwise duplicate the request on the same client
+        secondary = candidates[1] if len(candidates) > 1 else primary
+        tried = []
+        try:
+            return asyncio.run(_hedged_call(function, primary, secondary, policy, kwargs, tried))
+        except Exception as e:
+            logger.warning(f"Hedged {function} failed on {primary or 'default client'}: {e}")
+            last_error = e
+            # Fail over to the clients not called yet: the secondary too unless no hedge was sent
+            candidates = [client for client in candidates if client not in tried]
+
+    for client in candidates:
+        limiter = _provider_limiter(client)
+        limiter.acquire()
+        started = time.perf_counter()
+        try:
+            result = getattr(router.client(client), function)(**kwargs)
+        except Exception as e:
+            router.record(function, client, time.perf_counter() - started, ok=False)
+            _limiter_feedback(function, limiter, e)
+            logger.warning(f"{function} failed on {client or 'default client'}: {e}")
+            last_error = e
+            continue
+        router.record(function, client, time.perf_counter() - started, ok=True)
+        _limiter_feedback(function, limiter)
+        return result
+    raise last_error
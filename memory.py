@@ -0,0 +1,232 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from embeddings import HashingEmbedder
+from metrics import metrics
+from ranking import content_stems
+from results import ResultRecord
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Where the research memory is kept (HEKMATICA_MEMORY, default ./research_memory)
+MEMORY_PATH = os.environ.get("HEKMATICA_MEMORY", "research_memory")
+
+# How old a remembered result may be (seconds since its tool fetched it) and still stand in for a new
+# call to that tool. Tools not listed (LocalDocs: our own index is always current) are not remembered.
+MEMORY_MAX_AGE = {
+    "WebSearch": 7 * 24 * 3600,
+    "PriceLookup": 5 * 60,
+}
+
+MIN_SIMILARITY = 0.55  # cosine similarity between a step's query and a remembered result
+# Remembered results a step needs before its tool call is skipped (a price lookup has a single result)
+MIN_HITS = {
+    "WebSearch": 3,
+    "PriceLookup": 1,
+}
+# Superseded rows a process keeps before it reloads (and so compacts) the memory
+MIN_COMPACT_ROWS = 256
+
+
+def _grown(array: "np.ndarray", capacity: int) -> "np.ndarray":
+    """A copy of `array` with room for `capacity` rows (arrays in use by a recall stay untouched)."""
+    import numpy as np
+    grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class ResearchMemory:
+    """Ranked results of past runs, kept on disk with their embeddings and searched by similarity.
+
+    records.jsonl and vectors.f32 (float32 rows of HashingEmbedder vectors) are appended to and
+    line up row by row; processes sharing a path take a file lock (memory.lock) to write or load
+    them. A result seen again (same link) replaces its older row. Loading drops superseded and
+    expired rows from the files. The whole matrix is held in memory; a recall is one matrix-vector
+    product.
+    """
+
+    def __init__(self, path: str = MEMORY_PATH, embedder: Optional[HashingEmbedder] = None):
+        self.path = path
+        self.embedder = embedder or HashingEmbedder()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _reset(self):
+        import numpy as np
+        self._records: List[ResultRecord] = []
+        self._rows: Dict[str, int] = {}  # link -> row of its latest version
+        self._size = 0
+        self._vectors = np.zeros((64, self.embedder.dimensions), dtype=np.float32)
+        self._fetched_at = np.zeros(64)
+        self._tools = np.zeros(64, dtype=object)
+        self._alive = np.zeros(64, dtype=bool)
+        self._stems: Dict[int, frozenset] = {}  # row -> content_stems() of its text, computed on first recall
+
+    def _files(self):
+        return os.path.join(self.path, "records.jsonl"), os.path.join(self.path, "vectors.f32")
+
+    @contextmanager
+    def _files_locked(self):
+        """Exclusive lock on the memory files against other processes (prefork workers, batch runs)."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "memory.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self):
+        """(Re)load the memory from its files, first rewriting them without superseded or expired rows."""
+        import numpy as np
+        self._reset()
+        records_path, vectors_path = self._files()
+        if not os.path.exists(records_path):
+            return
+        with self._files_locked():
+            with open(records_path, encoding="utf-8") as f:
+                records = [ResultRecord(**json.loads(line)) for line in f if line.strip()]
+            vectors = np.fromfile(vectors_path, dtype=np.float32) if os.path.exists(vectors_path) else np.zeros(0, np.float32)
+            dimensions = self.embedder.dimensions
+            embed_again = vectors.size % dimensions or vectors.size // dimensions < len(records)
+            if embed_again:
+                # Written with other dimensions or cut short: embed the records again
+                vectors = self.embedder.embed_many(self._text(record) for record in records)
+            vectors = vectors.reshape(-1, dimensions)[:len(records)]
+            keep = self._current_rows(records)
+            if embed_again or len(keep) < len(records):
+                records, vectors = [records[row] for row in keep], vectors[keep]
+                self._rewrite(records, vectors)
+        self._append(records, vectors)
+
+    @staticmethod
+    def _current_rows(records: List[ResultRecord]) -> List[int]:
+        """Rows still worth keeping: the latest row of each link, if fresh enough to be recalled."""
+        now = time.time()
+        latest = {record.link: row for row, record in enumerate(records)}
+        return [row for row in sorted(latest.values())
+                if now - records[row].fetched_at <= MEMORY_MAX_AGE.get(records[row].tool, -1)]
+
+    def _rewrite(self, records: List[ResultRecord], vectors: "np.ndarray"):
+        records_path, vectors_path = self._files()
+        with open(records_path + ".tmp", "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(self._line(record))
+        vectors.tofile(vectors_path + ".tmp")
+        # Vectors first: records left longer than their vectors by a crash in between are embedded again
+        os.replace(vectors_path + ".tmp", vectors_path)
+        os.replace(records_path + ".tmp", records_path)
+
+    @staticmethod
+    def _line(record: ResultRecord) -> str:
+        return json.dumps({"content": record.content, "link": record.link, "query": record.query,
+                           "tool": record.tool, "fetched_at": record.fetched_at}) + "\n"
+
+    @staticmethod
+    def _text(record: ResultRecord) -> str:
+        # The query that found a result says what it is about as much as its text
+        return f"{record.query or ''}\n{record.content}"
+
+    def _append(self, records: List[ResultRecord], vectors: "np.ndarray"):
+        end = self._size + len(records)
+        if end > len(self._alive):
+            capacity = max(end, 2 * len(self._alive))
+            self._vectors, self._fetched_at, self._tools, self._alive = (
+                _grown(array, capacity) for array in (self._vectors, self._fetched_at, self._tools, self._alive))
+        rows = slice(self._size, end)
+        self._vectors[rows] = vectors
+        self._fetched_at[rows] = [record.fetched_at for record in records]
+        self._tools[rows] = [record.tool for record in records]
+        self._alive[rows] = True
+        for row, record in enumerate(records, start=self._size):
+            previous = self._rows.get(record.link)
+            if previous is not None:
+                self._alive[previous] = False
+            self._rows[record.link] = row
+        self._records.extend(records)
+        self._size = end
+
+    def add(self, results: Iterable[ResultRecord]):
+        """Remember results (typically a run's ranked results). Results without a link (nothing to
+        cite) and results already remembered with the same or a later fetch time are skipped."""
+        with self._lock:
+            new = []
+            for record in results:
+                if record.tool not in MEMORY_MAX_AGE or not record.content or not record.link:
+                    continue
+                row = self._rows.get(record.link)
+                if row is not None and self._records[row].fetched_at >= record.fetched_at:
+                    continue
+                new.append(replace(record, relevance_score=None))
+            if not new:
+                return
+            vectors = self.embedder.embed_many(self._text(record) for record in new)
+            records_path, vectors_path = self._files()
+            with self._files_locked():
+                with open(records_path, "a", encoding="utf-8") as f:
+                    f.write("".join(self._line(record) for record in new))
+                with open(vectors_path, "ab") as f:
+                    vectors.tofile(f)
+            self._append(new, vectors)
+            metrics.incr("memory.remembered", len(new))
+            superseded = self._size - len(self)
+            if superseded > max(MIN_COMPACT_ROWS, len(self)):
+                # Mostly results seen again (repeat price lookups): compact the files and start over from them
+                self._load()
+                metrics.incr("memory.compactions")
+
+    def recall(self, query: str, tool: str, max_results: int = 5, min_similarity: float = MIN_SIMILARITY) -> List[ResultRecord]:
+        """Fresh remembered results of `tool` similar to `query`, most similar first, tagged with `query`.
+
+        Similar embeddings are not enough: "dogecoin price history" is close to "bitcoin price history".
+        A result is only recalled if its query and content contain every content word of `query`.
+        """
+        import numpy as np
+        max_age = MEMORY_MAX_AGE.get(tool)
+        if max_age is None:
+            return []
+        vector = self.embedder.embed(query)
+        with self._lock:
+            size = self._size
+            vectors, fetched_at, tools, alive = self._vectors, self._fetched_at, self._tools, self._alive
+            records, stems_cache = self._records, self._stems
+        if not size:
+            return []
+        similarity = vectors[:size] @ vector
+        candidates = np.flatnonzero(alive[:size] & (tools[:size] == tool)
+                                    & (fetched_at[:size] >= time.time() - max_age) & (similarity >= min_similarity))
+        stems = content_stems(query)
+        recalled = []
+        for row in candidates[np.argsort(-similarity[candidates], kind="stable")].tolist():
+            row_stems = stems_cache.get(row)
+            if row_stems is None:
+                row_stems = stems_cache[row] = content_stems(self._text(records[row]))
+            if stems <= row_stems:
+                recalled.append(replace(records[row], query=query))
+                if len(recalled) == max_results:
+                    break
+        return recalled
+
+    def __len__(self):
+        return int(self._alive[:self._size].sum())
+
+
+_memory: Optional[ResearchMemory] = None
+_memory_lock = threading.Lock()
+
+
+def research_memory() -> ResearchMemory:
+    """The process-wide research memory at MEMORY_PATH, loaded on first use."""
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = ResearchMemory(MEMORY_PATH)
+        return _memory
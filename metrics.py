@@ -0,0 +1,69 @@
+import threading
+from collections import defaultdict
+
+
+class _Timing:
+    """Running count, total and maximum of one timing: constant memory and O(1) reads, however long the process runs."""
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class Metrics:
+    """Thread-safe in-process counters and timings shared by the agent, its tools and the LLM layer."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._timings = defaultdict(_Timing)
+        self._gauges = {}
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self._timings[name].add(seconds)
+
+    def set_gauge(self, name: str, value: float):
+        """Record the current value of `name` (e.g. a circuit breaker's state)."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def mean(self, name: str):
+        """Mean of the observed timings for `name`, or None if nothing was observed yet."""
+        with self._lock:
+            timing = self._timings.get(name)
+            return timing.total / timing.count if timing else None
+
+    def snapshot(self):
+        """Return a plain dict of all counters, gauges and timing summaries (count, mean, max)."""
+        with self._lock:
+            timings = {
+                name: {"count": timing.count, "mean": timing.total / timing.count, "max": timing.max}
+                for name, timing in self._timings.items()
+            }
+            return {"counters": dict(self._counters), "gauges": dict(self._gauges), "timings": timings}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+            self._gauges.clear()
+
+
+# Process-wide metrics registry
+metrics = Metrics()
@@ -0,0 +1,110 @@
+import re
+from typing import List, Optional, Tuple
+
+from baml_client.types import Plan, Step, Tool
+
+from docindex import doc_index
+from metrics import metrics
+from ranking import tokenize
+from tools import find_coin_ids, tool_available
+
+# Plans below this confidence are handed to the PlanSteps LLM call instead
+PLANNER_CONFIDENCE_THRESHOLD = 0.7
+# PlanSteps is asked to use at most 5 steps, keep the local planner consistent with it
+MAX_PLAN_STEPS = 5
+
+PRICE_WORDS = {"price", "prices", "cost", "worth", "value", "trading", "usd", "quote", "rate"}
+# Words that leave a price lookup a price lookup ("what is the current price of one BTC in USD right now")
+LOOKUP_FILLER = {
+    "what", "whats", "s", "is", "the", "of", "a", "one", "1", "in", "current", "currently", "latest", "live",
+    "today", "todays", "now", "right", "usd", "dollar", "dollars", "us", "per", "spot", "market", "how", "much",
+    "check", "get", "show", "tell", "give", "me",
+}
+# Share of a subquery's terms the best LocalDocs passage must contain for the subquery to be looked up there too
+LOCAL_DOCS_MIN_COVERAGE = 0.6
+# Words that turn a price mention into an informational query (history, outlook, reasons...)
+NON_LOOKUP_WORDS = {
+    "history", "historical", "prediction", "predictions", "forecast", "outlook", "chart", "trend", "trends",
+    "why", "analysis", "news", "drop", "crash", "rally", "volatility", "ago", "last", "year", "years",
+    "month", "months", "week", "weeks", "since", "all-time", "ath", "compare", "comparison", "vs", "versus",
+}
+
+
+def _plan_subquery(subquery: str) -> Tuple[List[Step], float]:
+    """Derive the steps for one subquery together with a confidence in [0, 1]."""
+    words = set(re.findall(r"[a-z0-9-]+", subquery.lower()))
+    coin_ids = find_coin_ids(subquery)
+    asks_price = bool(words & PRICE_WORDS)
+    informational = bool(words & NON_LOOKUP_WORDS)
+
+    if coin_ids and asks_price and not informational:
+        other_words = {word for word in words - PRICE_WORDS - LOOKUP_FILLER if not find_coin_ids(word)}
+        if not other_words:
+            # "bitcoin price", "current ETH value": a direct lookup per coin
+            return [Step(tool=Tool.PriceLookup, query=coin_id) for coin_id in coin_ids], 0.95
+        # Broad price words about something else ("value proposition", "transaction cost", "adoption
+        # rate", "worth investing in"): research it, and let PlanSteps decide when it can
+        return [Step(tool=Tool.WebSearch, query=subquery)], 0.5
+    if asks_price and not coin_ids and not informational:
+        # A price of something we cannot look up (stocks, commodities...): let the LLM decide
+        return [Step(tool=Tool.WebSearch, query=subquery)], 0.4
+    if coin_ids and asks_price:
+        # Price history / outlook of a known coin is web research
+        return [Step(tool=Tool.WebSearch, query=subquery)], 0.8
+    return [Step(tool=Tool.WebSearch, query=subquery)], 0.9
+
+
+def _covered_by_local_docs(subquery: str) -> bool:
+    """Whether our own documents have a passage about the subquery (a LocalDocs lookup takes milliseconds)."""
+    if not tool_available("LocalDocs"):
+        return False
+    hits = doc_index().search(subquery, max_results=1)
+    return bool(hits) and hits[0]["matched"] >= max(1.0, LOCAL_DOCS_MIN_COVERAGE * len(set(tokenize(subquery))))
+
+
+def local_plan(subqueries: List[str]) -> Tuple[Optional[Plan], float]:
+    """Build a Plan from the subqueries without an LLM call.
+
+    Returns the plan and its confidence (the lowest confidence of any subquery).
+    The plan is None when there is nothing to plan.
+    """
+    price_steps: List[Step] = []
+    docs_steps: List[Step] = []
+    search_steps: List[Step] = []
+    confidence = 1.0
+    for subquery in subqueries:
+        subquery = subquery.strip()
+        if not subquery:
+            continue
+        steps, step_confidence = _plan_subquery(subquery)
+        confidence = min(confidence, step_confidence)
+        for step in steps:
+            if step.tool == Tool.PriceLookup:
+                if all(s.query != step.query for s in price_steps):
+                    price_steps.append(step)
+            else:
+                search_steps.append(step)
+        if _covered_by_local_docs(subquery):
+            docs_steps.append(Step(tool=Tool.LocalDocs, query=subquery))
+
+    steps = (price_steps + docs_steps + search_steps)[:MAX_PLAN_STEPS]
+    if not steps:
+        return None, 0.0
+    return Plan(steps=steps), confidence
+
+
+def planner_report():
+    """Summarize how often the local planner replaced the PlanSteps LLM call and the time that saved."""
+    local_hits = metrics.count("planner.local")
+    llm_calls = metrics.count("planner.llm")
+    total = local_hits + llm_calls
+    mean_llm_seconds = metrics.mean("planner.llm_seconds")
+    return {
+        "runs": total,
+        "local_hits": local_hits,
+        "llm_fallbacks": llm_calls,
+        "hit_rate": local_hits / total if total else 0.0,
+        "llm_calls_saved": local_hits,
+        # Estimated from the observed PlanSteps latency of this process
+        "estimated_seconds_saved": local_hits * mean_llm_seconds if mean_llm_seconds is not None else None,
+    }
@@ -0,0 +1,82 @@
+import importlib
+import os
+import signal
+import sys
+import time
+import traceback
+from typing import Callable
+
+# Slow imports that are safe to share with forked workers: pure Python or native modules that
+# start no threads. baml_client is deliberately missing: importing it starts the BAML runtime's
+# tokio threads, which do not survive fork() (calls in the child hang or crash), so every worker
+# imports it, and with it the agent, after forking.
+WARMUP_MODULES = [
+    "pydantic",
+    "baml_py",
+    "langgraph.graph",
+    "langgraph.types",
+    "langgraph.checkpoint.sqlite",
+    "langchain_community.tools",
+    "requests",
+    "tools",
+    "search_backends",
+    "ranking",
+    "metrics",
+    "checkpointing",
+]
+
+
+def warmup() -> float:
+    """Import the fork-safe dependencies and create the shared tool clients in this process.
+
+    Returns the seconds it took.
+    """
+    started = time.perf_counter()
+    for module in WARMUP_MODULES:
+        importlib.import_module(module)
+    import tools
+    tools.search_tool()
+    tools.http_session()
+    return time.perf_counter() - started
+
+
+def run_workers(workers: int, worker: Callable[[int], None]) -> int:
+    """Warm up once, then fork `workers` processes that each run worker(index).
+
+    The workers share the parent's imported modules and tool clients copy-on-write, so each one only
+    pays for the BAML runtime and its graph before it can serve. SIGINT and SIGTERM are passed on to
+    the workers. Returns the number of workers that exited with an error.
+    """
+    if "baml_client" in sys.modules:
+        raise RuntimeError("baml_client was imported before forking; the BAML runtime does not survive fork()")
+    print(f"Warmed up in {warmup():.2f}s, starting {workers} workers")
+
+    children = {}
+    for index in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                worker(index)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def forward(signum, frame):
+        for pid in list(children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    failures = 0
+    while children:
+        pid, status = os.wait()
+        if children.pop(pid, None) is not None and os.waitstatus_to_exitcode(status) != 0:
+            failures += 1
+    return failures
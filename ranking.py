@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import math
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from results import ResultRecord
+from scheduler import submit_in_context
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STEM_LENGTH = 5  # content words are compared by their first letters: "factor" / "factors", "rotation" / "rotations"
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it", "of", "on",
+    "or", "that", "the", "this", "to", "was", "were", "what", "when", "where", "which", "who", "why", "with",
+}
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase word tokens without stopwords."""
+    if not text:
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def content_stems(text: Optional[str]) -> frozenset:
+    """Content words of a text, crudely stemmed. Rewordings that only change word order, stopwords,
+    punctuation or inflections keep the same stems; other words, numbers or years change them."""
+    return frozenset(token[:STEM_LENGTH] for token in tokenize(text) if len(token) > 1 or token.isdigit())
+
+
+def local_rank(question: str, subqueries: List[str], results: List[ResultRecord], top_k: int = 5):
+    """Rank results by IDF-weighted term overlap with the question and subqueries, without an LLM call.
+
+    Returns up to `top_k` results ordered best first, carrying a relevance_score on the same 0-10
+    scale as RankResults.
+    """
+    documents = [set(tokenize(result.content)) for result in results]
+    if not documents:
+        return []
+    document_frequency = Counter(token for document in documents for token in document)
+    idf = {token: math.log(1 + len(documents) / df) for token, df in document_frequency.items()}
+
+    weights = query_weights(question, subqueries)
+    max_score = sum(weight * idf.get(token, 0.0) for token, weight in weights.items()) or 1.0
+
+    scored = []
+    for position, (result, document) in enumerate(zip(results, documents)):
+        if not result.content:
+            continue
+        score = sum(weight * idf.get(token, 0.0) for token, weight in weights.items() if token in document)
+        relevance = round(10 * score / max_score)
+        scored.append((-relevance, position, result.scored(relevance)))
+    scored.sort(key=lambda item: (item[0], item[1]))
+    return [result for _, _, result in scored[:top_k]]
+
+
+def query_weights(question: str, subqueries: List[str]) -> Counter:
+    """Term weights of the information need: question terms count double, subquery terms once."""
+    weights = Counter()
+    for token in tokenize(question):
+        weights[token] += 2
+    for subquery in subqueries:
+        for token in tokenize(subquery):
+            weights[token] += 1
+    return weights
+
+
+def local_score(weights: Counter, content: Optional[str]) -> int:
+    """0-10 relevance of one result from the share of query term weight it covers (no corpus statistics
+    needed, so results can be scored one at a time as they arrive)."""
+    total = sum(weights.values())
+    if not total or not content:
+        return 0
+    words = set(tokenize(content))
+    return round(10 * sum(weight for token, weight in weights.items() if token in words) / total)
+
+
+class IncrementalRanker:
+    """Keeps the top-k results while results stream in from the tools.
+
+    Results are scored locally as soon as they are added, or, when `score_batch` is given, in
+    micro-batches of `batch_size` that are scored concurrently (e.g. by RankResults) while later
+    searches are still running. `finish()` flushes the last batch and returns the top-k, best first.
+    """
+
+    def __init__(self, question: str, subqueries: List[str], top_k: int = 5,
+                 score_batch: Optional[Callable[[List[ResultRecord]], List[ResultRecord]]] = None, batch_size: int = 5):
+        self.weights = query_weights(question, subqueries)
+        self.top_k = top_k
+        self.score_batch = score_batch
+        self.batch_size = batch_size
+        self._heap = []  # min-heap of (score, -arrival, result) holding the current top-k
+        self._arrival = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._batches = []
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rank-batch") if score_batch else None
+
+    def _push(self, result: ResultRecord):
+        entry = (result.relevance_score or 0, -next(self._arrival), result)
+        with self._lock:
+            if len(self._heap) < self.top_k:
+                heapq.heappush(self._heap, entry)
+            elif entry[:2] > self._heap[0][:2]:
+                heapq.heapreplace(self._heap, entry)
+
+    def _score_and_push(self, batch: List[ResultRecord]):
+        for result in self.score_batch(batch):
+            self._push(result)
+
+    def add(self, results: List[ResultRecord]):
+        """Feed newly arrived results into the ranking."""
+        for result in results:
+            if not result.content:
+                continue
+            if self.score_batch is None:
+                self._push(result.scored(local_score(self.weights, result.content)))
+                continue
+            with self._lock:
+                self._pending.append(result)
+                batch = self._pending if len(self._pending) >= self.batch_size else None
+                if batch:
+                    self._pending = []
+            if batch:
+                self._batches.append(submit_in_context(self._executor, self._score_and_push, batch))
+
+    def finish(self) -> List[ResultRecord]:
+        """Score what is still pending, wait for outstanding batches and return the top-k, best first."""
+        if self.score_batch is not None:
+            if self._pending:
+                self._batches.append(submit_in_context(self._executor, self._score_and_push, self._pending))
+                self._pending = []
+            for batch in self._batches:
+                batch.result()
+            self._executor.shutdown()
+        with self._lock:
+            return [result for *_, result in sorted(self._heap, key=lambda entry: entry[:2], reverse=True)]
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from metrics import metrics
+
+# Requests per second and burst size allowed per upstream, kept just under the providers' published
+# or observed limits. Override with HEKMATICA_RATE_LIMITS="duckduckgo=1:2,coingecko=0.2" (rate[:burst]).
+RATE_LIMITS = {
+    "duckduckgo": (1.0, 3),  # no published limit; bursts of searches get "202 Ratelimit" answers
+    "coingecko": (0.4, 5),  # public API: roughly 30 calls per minute
+    "gemini": (5.0, 10),
+    "openai": (8.0, 16),
+    "anthropic": (4.0, 8),
+}
+
+MIN_RATE_FRACTION = 0.05  # backoff never drops below this fraction of the configured rate
+BACKOFF_FACTOR = 0.5  # rate multiplier applied when the upstream answers 429
+PROBE_INTERVAL = 5.0  # seconds of successful calls between two rate increases
+PROBE_STEP_FRACTION = 0.1  # each increase adds this fraction of the configured rate
+
+
+class TokenBucket:
+    """Token bucket for one upstream, shared by threads and asyncio tasks (AIMD adaptive rate).
+
+    `rate` starts at the configured limit. Every throttling answer (429) halves it and empties the
+    bucket, and after PROBE_INTERVAL seconds of successful calls it grows by a step again, up to the
+    configured limit. Callers reserve a token and sleep until it is due, so waiting callers are spaced
+    evenly instead of waking up together.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.limit = rate
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._last_change = self._updated
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, timeout: Optional[float]) -> Optional[float]:
+        """Take a token; returns the seconds until it may be used, or None if that exceeds `timeout`."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, (1.0 - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                return None
+            self._tokens -= 1.0
+            return wait
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a token (threads). Returns False without waiting if none is due within `timeout`."""
+        wait = self._reserve(timeout)
+        if wait is None:
+            metrics.incr(f"ratelimit.{self.name}.rejected")
+            return False
+        if wait:
+            metrics.observe(f"ratelimit.{self.name}.wait_seconds", wait)
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """acquire() for coroutines: sleeps on the event loop instead of blocking the thread."""
+        wait = self._reserve(timeout)
+        if wait is None:
+            metrics.incr(f"ratelimit.{self.name}.rejected")
+            return False
+        if wait:
+            metrics.observe(f"ratelimit.{self.name}.wait_seconds", wait)
+            await asyncio.sleep(wait)
+        return True
+
+    def throttled(self, retry_after: Optional[float] = None):
+        """The upstream rejected a call for exceeding its limit: back off multiplicatively."""
+        metrics.incr(f"ratelimit.{self.name}.throttled")
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Calls already in flight when the limit was hit report it too; back off once per burst
+            if now - self._last_change >= 1.0 / self.rate:
+                self.rate = max(self.limit * MIN_RATE_FRACTION, self.rate * BACKOFF_FACTOR)
+            self._last_change = now
+            # Pause for the advertised time (or one token's worth), then resume at the lower rate
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self._tokens = min(self._tokens, 0.0) - pause * self.rate
+
+    def succeeded(self):
+        """The upstream accepted a call: probe back up towards the configured limit."""
+        with self._lock:
+            now = time.monotonic()
+            if self.rate < self.limit and now - self._last_change >= PROBE_INTERVAL:
+                self.rate = min(self.limit, self.rate + self.limit * PROBE_STEP_FRACTION)
+                self._last_change = now
+
+    def summary(self):
+        with self._lock:
+            return {"rate": round(self.rate, 3), "limit": self.limit, "burst": self.burst,
+                    "tokens": round(max(self._tokens, 0.0), 2)}
+
+
+def _configured_limits() -> Dict[str, tuple]:
+    limits = dict(RATE_LIMITS)
+    for item in os.environ.get("HEKMATICA_RATE_LIMITS", "").split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        rate, _, burst = value.partition(":")
+        limits[name.strip()] = (float(rate), int(burst) if burst else max(1, int(float(rate))))
+    return limits
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def rate_limiter(upstream: str) -> TokenBucket:
+    """The process-wide token bucket of `upstream` (created from RATE_LIMITS on first use)."""
+    with _buckets_lock:
+        if upstream not in _buckets:
+            rate, burst = _configured_limits().get(upstream, (10.0, 10))
+            _buckets[upstream] = TokenBucket(upstream, rate, burst)
+        return _buckets[upstream]
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Whether `error` is an upstream's "too many requests" answer (HTTP 429 or the DuckDuckGo ratelimit)."""
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    if status == 429:
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return "ratelimit" in text or "rate limit" in text or "429" in text or "too many requests" in text
+
+
+def rate_limit_report():
+    with _buckets_lock:
+        return {name: bucket.summary() for name, bucket in _buckets.items()}
@@ -0,0 +1,60 @@
+import sys
+import time
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    from baml_client.types import ContextItem, RankedResultItem, ResultItem
+
+
+@dataclass(slots=True)
+class ResultRecord:
+    """One search or price result, from the tool that fetched it to the answer context.
+
+    A slotted dataclass instead of a dict: a fraction of the memory per result, and pydantic
+    accepts instances in AgentState without re-validating their fields on every node update.
+    Records are shared (tool caches, checkpoints), so they are never modified: scoring
+    returns a scored copy that shares the content and link strings.
+    """
+    content: str
+    link: Optional[str] = None
+    query: Optional[str] = None  # the plan or refinement query that found this result
+    relevance_score: Optional[int] = None  # 0-10, set once the result is ranked
+    tool: str = "WebSearch"  # the plan tool (Tool value) that produced the result
+    fetched_at: float = field(default_factory=time.time)  # when the tool fetched it (time.time())
+
+    def __post_init__(self):
+        # The same links and queries recur across searches, refinement rounds and runs: share one copy
+        if self.link is not None:
+            self.link = sys.intern(self.link)
+        if self.query is not None:
+            self.query = sys.intern(self.query)
+
+    def scored(self, relevance_score: int) -> "ResultRecord":
+        return replace(self, relevance_score=relevance_score)
+
+    # Conversions at the BAML call boundaries; the values are already valid, so they skip validation.
+    # baml_client is imported here rather than at module level: importing it builds the BAML runtime.
+    def to_result_item(self) -> "ResultItem":
+        from baml_client.types import ResultItem
+        return ResultItem.model_construct(content=self.content, link=self.link)
+
+    def to_context_item(self) -> "ContextItem":
+        from baml_client.types import ContextItem
+        return ContextItem.model_construct(content=self.content, source=self.link)
+
+
+def apply_ranking(results: List[ResultRecord], ranked: Iterable["RankedResultItem"]) -> List[ResultRecord]:
+    """Map RankResults output back onto the records it was given, in ranked order, with their scores."""
+    by_key = {}
+    for result in results:
+        by_key.setdefault(result.link or result.content, result)
+    ranked_results = []
+    for item in ranked:
+        original = by_key.get(item.link or item.content)
+        if original is None:
+            # Not one of the inputs (the LLM rewrote the link): keep what it returned
+            ranked_results.append(ResultRecord(content=item.content or "", link=item.link, relevance_score=item.relevance_score))
+        else:
+            ranked_results.append(original.scored(item.relevance_score))
+    return ranked_results
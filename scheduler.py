@@ -0,0 +1,214 @@
+import asyncio
+import heapq
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Deque, Dict, Optional
+
+# Priority classes, most urgent first. Runs without a class (CLI) count as interactive.
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# Priority class of the run executing in the current context; read by the LLM and tool call limits
+current_priority: ContextVar[int] = ContextVar("current_priority", default=PRIORITIES["interactive"])
+
+
+@contextmanager
+def run_priority(priority: str):
+    """Run the enclosed research run with the given priority class."""
+    token = current_priority.set(PRIORITIES[priority])
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def submit_in_context(executor, fn, *args):
+    """executor.submit() that carries the caller's context (run priority) into the worker thread."""
+    return executor.submit(copy_context().run, fn, *args)
+
+
+class PrioritySemaphore:
+    """Thread-safe counting semaphore that admits waiting callers by priority class, then in arrival order.
+
+    Bounds the LLM and tool calls in flight across all runs in the process, so that when the limit
+    is reached an interactive run's next call goes ahead of the calls queued by batch runs.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._in_use = 0
+        self._waiters = []  # heap of (priority, arrival, threading.Event)
+        self._arrival = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None, priority: Optional[int] = None) -> bool:
+        """Take a slot, waiting at most `timeout` seconds. Returns False if none became free in time."""
+        priority = current_priority.get() if priority is None else priority
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return True
+            waiter = (priority, next(self._arrival), threading.Event())
+            heapq.heappush(self._waiters, waiter)
+        if waiter[2].wait(None if timeout is None else max(timeout, 0.0)):
+            return True
+        with self._lock:
+            if waiter[2].is_set():
+                return True  # the slot was handed over just as the wait timed out
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            return False
+
+    def release(self):
+        with self._lock:
+            if self._waiters and self._in_use <= self.limit:
+                # Hand the slot straight to the most urgent waiter
+                heapq.heappop(self._waiters)[2].set()
+            else:
+                self._in_use -= 1
+
+    def set_limit(self, limit: int):
+        with self._lock:
+            self.limit = limit
+            while self._waiters and self._in_use < self.limit:
+                self._in_use += 1
+                heapq.heappop(self._waiters)[2].set()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """Hold a slot for the enclosed call; raises TimeoutError if none is free within `timeout`."""
+        if not self.acquire(timeout):
+            raise TimeoutError("no free slot")
+        try:
+            yield
+        finally:
+            self.release()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+
+class _Tenant:
+    def __init__(self, weight: float, cap: Optional[int]):
+        self.weight = weight
+        self.cap = cap
+        self.queues: Dict[int, Deque[Any]] = {}  # priority class -> queued jobs
+        self.running = 0
+        self.virtual_time = 0.0  # service received so far, divided by the weight
+
+
+class FairScheduler:
+    """Job queue that decides which research run starts next (event loop thread only).
+
+    Priority classes are strict: a batch job only starts when no interactive job can. Within a
+    class, tenants (API keys) share the workers in proportion to their weights: the tenant with
+    the least weighted service so far goes next (stride scheduling). Tenants at their concurrency
+    cap are skipped, so their queued jobs wait while others run. Jobs need `tenant` and
+    `priority` attributes.
+    """
+
+    def __init__(self, maxsize: int, weights: Optional[Dict[str, float]] = None, caps: Optional[Dict[str, int]] = None,
+                 default_weight: float = 1.0, default_cap: Optional[int] = None):
+        self.maxsize = maxsize
+        self.weights = weights or {}
+        self.caps = caps or {}
+        self.default_weight = default_weight
+        self.default_cap = default_cap
+        self._tenants: Dict[str, _Tenant] = {}
+        self._queued = 0
+        self._running = 0
+        self._changed = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def qsize(self) -> int:
+        return self._queued
+
+    def full(self) -> bool:
+        return self._queued >= self.maxsize
+
+    def put_nowait(self, job):
+        """Queue a job; raises asyncio.QueueFull when the scheduler holds `maxsize` jobs."""
+        if self.full():
+            raise asyncio.QueueFull
+        tenant = self._tenant(job.tenant)
+        priority = PRIORITIES[job.priority]
+        if not any(tenant.queues.values()) and tenant.running == 0:
+            # A tenant returning from idle starts level with the least served active tenant instead of
+            # with the credit it built up while idle
+            active = [t.virtual_time for t in self._tenants.values() if t is not tenant and (t.running or any(t.queues.values()))]
+            if active:
+                tenant.virtual_time = max(tenant.virtual_time, min(active))
+        tenant.queues.setdefault(priority, deque()).append(job)
+        self._queued += 1
+        self._idle.clear()
+        self._wake()
+
+    async def get(self):
+        """Wait for the next job that may start, and mark it running."""
+        while True:
+            job = self._pop()
+            if job is not None:
+                return job
+            changed = self._changed
+            await changed.wait()
+
+    def clear(self):
+        """Remove and return every queued job (used when shutting down)."""
+        jobs = [job for tenant in self._tenants.values() for queue in tenant.queues.values() for job in queue]
+        for tenant in self._tenants.values():
+            tenant.queues.clear()
+        self._queued = 0
+        if self._running == 0:
+            self._idle.set()
+        return jobs
+
+    def done(self, job):
+        """Mark a job returned by get() as finished, freeing its tenant's slot."""
+        self._tenants[job.tenant].running -= 1
+        self._running -= 1
+        if self._running == 0 and self._queued == 0:
+            self._idle.set()
+        self._wake()
+
+    async def join(self):
+        """Wait until no job is queued or running."""
+        await self._idle.wait()
+
+    def tenant_report(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"queued": sum(len(q) for q in t.queues.values()), "running": t.running,
+                   "weight": t.weight, "cap": t.cap}
+            for name, t in self._tenants.items()
+        }
+
+    def _tenant(self, name: str) -> _Tenant:
+        if name not in self._tenants:
+            self._tenants[name] = _Tenant(self.weights.get(name, self.default_weight), self.caps.get(name, self.default_cap))
+        return self._tenants[name]
+
+    def _pop(self):
+        for priority in sorted(PRIORITIES.values()):
+            eligible = [t for t in self._tenants.values()
+                        if t.queues.get(priority) and (t.cap is None or t.running < t.cap)]
+            if not eligible:
+                continue
+            tenant = min(eligible, key=lambda t: t.virtual_time)
+            job = tenant.queues[priority].popleft()
+            tenant.virtual_time += 1.0 / tenant.weight
+            tenant.running += 1
+            self._queued -= 1
+            self._running += 1
+            return job
+        return None
+
+    def _wake(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
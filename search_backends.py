@@ -0,0 +1,161 @@
+import heapq
+import html
+import json
+import logging
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional
+
+from ranking import tokenize
+
+logger = logging.getLogger("SearchTool")
+
+
+class SearchBackend:
+    """A search engine behind `web_search`.
+
+    search() returns up to `max_results` results, best first, as {"content": ..., "link": ...} dicts
+    (callers must not modify them). Backends are created once and shared by every call in the
+    process, so they may keep clients, connections or indexes around.
+    """
+
+    name = "base"
+    # Upstream rate limit and circuit breaker the backend's calls go through (None: no network calls)
+    upstream: Optional[str] = None
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        raise NotImplementedError
+
+
+class DuckDuckGoBackend(SearchBackend):
+    """Web search through langchain_community's DuckDuckGoSearchResults (the default backend)."""
+
+    name = "duckduckgo"
+    upstream = "duckduckgo"
+
+    def __init__(self):
+        self._tool = None
+        self._lock = threading.Lock()
+
+    def tool(self):
+        """The DuckDuckGo search tool (list output), created on first use: importing it is slow."""
+        with self._lock:
+            if self._tool is None:
+                from langchain_community.tools import DuckDuckGoSearchResults
+                self._tool = DuckDuckGoSearchResults(output_format="list")
+            return self._tool
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        results = []
+        # Limit results manually
+        for item in self.tool().invoke(query)[:max_results]:
+            # Ensure item is a dictionary before proceeding
+            if not isinstance(item, dict):
+                logger.warning(f"Skipping unexpected search result format: {item}")
+                continue
+            title = html.unescape(item.get("title", ""))
+            snippet = html.unescape(item.get("snippet", ""))
+            content = (title + ": " + snippet if snippet else title).strip()
+            link = item.get("link", "")
+            if content and link:  # Only add if both content and link are present
+                results.append({"content": content, "link": link})
+        return results
+
+
+class LocalCorpusBackend(SearchBackend):
+    """Searches an on-disk corpus without network access, for offline runs, benchmarks and internal knowledge.
+
+    `path` (default: HEKMATICA_CORPUS or ./corpus) is a directory or a single file. JSONL files hold one
+    {"content", "link"} result per line (e.g. saved search results); text and markdown files are split
+    into paragraphs linked as file://<path>#p<n>. The corpus is read once into an in-memory inverted
+    index (token -> [(document, term frequency)]) and queries are scored with TF-IDF.
+    """
+
+    name = "local"
+    TEXT_SUFFIXES = (".txt", ".md")
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("HEKMATICA_CORPUS", "corpus")
+        self.documents: List[Dict[str, str]] = []
+        self.postings: Dict[str, List[tuple]] = defaultdict(list)
+        self._load()
+
+    def _load(self):
+        if os.path.isdir(self.path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(self.path) for name in names)
+        elif os.path.exists(self.path):
+            files = [self.path]
+        else:
+            logger.warning(f"Search corpus {self.path} does not exist, local search returns nothing")
+            files = []
+        for file_path in files:
+            if file_path.endswith(".jsonl"):
+                with open(file_path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            self.add(record["content"], record["link"])
+            elif file_path.endswith(self.TEXT_SUFFIXES):
+                with open(file_path, encoding="utf-8") as f:
+                    paragraphs = [" ".join(p.split()) for p in f.read().split("\n\n")]
+                link = "file://" + os.path.abspath(file_path)
+                for number, paragraph in enumerate(paragraphs):
+                    if paragraph:
+                        self.add(paragraph, f"{link}#p{number}")
+        logger.info(f"Indexed {len(self.documents)} documents from {self.path}")
+
+    def add(self, content: str, link: str):
+        """Index one result."""
+        document_id = len(self.documents)
+        self.documents.append({"content": content, "link": link})
+        for token, frequency in Counter(tokenize(content)).items():
+            self.postings[token].append((document_id, frequency))
+
+    def search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + len(self.documents) / len(postings))
+            for document_id, frequency in postings:
+                scores[document_id] += idf * (1 + math.log(frequency))
+        best = heapq.nlargest(max_results, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.documents[document_id] for document_id, _ in best]
+
+
+# Backend factories by name; register_backend() adds more
+BACKENDS: Dict[str, Callable[[], SearchBackend]] = {
+    "duckduckgo": DuckDuckGoBackend,
+    "local": LocalCorpusBackend,
+}
+
+default_backend = os.environ.get("HEKMATICA_SEARCH_BACKEND", "duckduckgo")
+_instances: Dict[str, SearchBackend] = {}
+_instances_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[[], SearchBackend]):
+    """Make a backend available as `name` (replacing any backend of that name)."""
+    with _instances_lock:
+        BACKENDS[name] = factory
+        _instances.pop(name, None)
+
+
+def set_default_backend(name: str):
+    """Send web_search to the backend `name` from now on."""
+    global default_backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown search backend {name!r}; known: {', '.join(BACKENDS)}")
+    default_backend = name
+
+
+def search_backend(name: Optional[str] = None) -> SearchBackend:
+    """The shared instance of backend `name` (default: the default backend), created on first use."""
+    name = name or default_backend
+    with _instances_lock:
+        if name not in _instances:
+            _instances[name] = BACKENDS[name]()
+        return _instances[name]
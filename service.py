@@ -0,0 +1,471 @@
+import argparse
+import asyncio
+import json
+import math
+import signal
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+import socket
+import sys
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from circuit import circuit_report
+import search_backends
+from metrics import metrics
+from ratelimit import rate_limit_report
+from scheduler import PRIORITIES, FairScheduler, run_priority
+from tools import tool_slots
+
+if TYPE_CHECKING:
+    # Imported where used instead: the agent (and its BAML runtime) must load after a pre-fork
+    from agent import DeepResearchAgent
+
+# Defaults: jobs waiting to run, runs in parallel, and the longest deadline a request may ask for (seconds)
+QUEUE_SIZE = 64
+WORKERS = 4
+MAX_DEADLINE = 600.0
+# How long finished jobs stay pollable, and how long a job waits for its clarification before it expires (seconds)
+JOB_RETENTION = 3600
+CLARIFICATION_RETENTION = 24 * 3600
+# Retry-After estimate per queued job before any run has been timed (seconds)
+DEFAULT_RUN_SECONDS = 30.0
+MAX_BODY_BYTES = 64 * 1024
+REQUEST_READ_TIMEOUT = 10.0
+
+# Job statuses after which the job waits for nothing but the client
+FINAL_STATUSES = {"done", "failed", "expired", "needs_clarification"}
+# Job statuses that never change again (pruned after JOB_RETENTION)
+TERMINAL_STATUSES = {"done", "failed", "expired"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+@dataclass
+class Job:
+    """One research request and everything reported about it so far."""
+    id: str
+    question: str
+    clarification: Optional[str] = None  # clarification answer to start or resume the run with
+    deadline: Optional[float] = None  # time.time() by which the answer is due
+    tenant: str = "anonymous"  # who submitted it (X-Tenant header), for fair sharing and caps
+    priority: str = "interactive"  # priority class, see scheduler.PRIORITIES
+    status: str = "queued"
+    output: Optional[str] = None
+    clarification_question: Optional[str] = None
+    error: Optional[str] = None
+    resume: bool = False  # continue the checkpointed run instead of starting it
+    created_at: float = field(default_factory=time.time)
+    queued_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    changed: asyncio.Event = field(default_factory=asyncio.Event)  # set (and replaced) on every new event
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "question": self.question,
+            "tenant": self.tenant,
+            "priority": self.priority,
+            "status": self.status,
+            "output": self.output,
+            "clarification_question": self.clarification_question,
+            "error": self.error,
+            "deadline": self.deadline,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ResearchService:
+    """Async HTTP front end for a DeepResearchAgent.
+
+    Requests are queued in a bounded FairScheduler and run by a pool of worker threads; a full
+    queue is answered with 429 and a Retry-After estimate. Interactive jobs start before batch
+    jobs, and tenants share the workers by weight, up to their concurrency caps. Endpoints:
+
+        POST /research                       {"question", "clarification"?, "deadline"?, "priority"?} -> 202 job
+        GET  /research/<id>                  poll the job
+        GET  /research/<id>/stream           server-sent events: status changes and completed nodes
+        POST /research/<id>/clarification    {"answer"} continues a run waiting for clarification
+        GET  /health
+
+    In pre-fork mode (`process_ports`), this is the service of process `process` of several that
+    share a listening socket. Jobs live in the process that accepted them: their ids start with the
+    process index, and requests for another process's job are redirected (307) to that process's
+    own port.
+    """
+
+    def __init__(self, agent: "DeepResearchAgent", workers: int = WORKERS, queue_size: int = QUEUE_SIZE,
+                 default_deadline: Optional[float] = None, max_deadline: float = MAX_DEADLINE,
+                 tenant_weights: Optional[Dict[str, float]] = None, tenant_caps: Optional[Dict[str, int]] = None,
+                 default_tenant_cap: Optional[int] = None, process: int = 0, process_ports: Optional[List[int]] = None):
+        self.agent = agent
+        self.process = process
+        self.process_ports = process_ports
+        self.workers = workers
+        self.default_deadline = default_deadline
+        self.max_deadline = max_deadline
+        self.jobs: Dict[str, Job] = {}
+        self.scheduler = FairScheduler(queue_size, weights=tenant_weights, caps=tenant_caps, default_cap=default_tenant_cap)
+        self.running = 0
+        self.draining = False
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="research")
+        self._worker_tasks: List[asyncio.Task] = []
+        self._servers: List[asyncio.AbstractServer] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000, sock: Optional[socket.socket] = None):
+        """Listen on host:port, and on the pre-fork listening socket `sock` when given."""
+        self._loop = asyncio.get_running_loop()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._servers = [await asyncio.start_server(self._handle, host, port)]
+        if sock is not None:
+            self._servers.append(await asyncio.start_server(self._handle, sock=sock))
+        return self._servers
+
+    async def drain(self, timeout: float = 60.0):
+        """Stop accepting requests and let queued and running jobs finish (up to `timeout` seconds)."""
+        self.draining = True
+        for server in self._servers:
+            server.close()
+        try:
+            await asyncio.wait_for(self.scheduler.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Drain timed out after {timeout:.0f}s, abandoning {self.scheduler.qsize()} queued jobs")
+            for job in self.scheduler.clear():
+                self._finish(job, "failed", error="the service shut down before the job ran")
+        for task in self._worker_tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # Jobs
+
+    def submit(self, question: str, clarification: Optional[str] = None, deadline: Optional[float] = None,
+               tenant: str = "anonymous", priority: str = "interactive") -> Job:
+        """Queue a new research job. Raises HTTPError 429 (queue full) or 503 (draining)."""
+        if priority not in PRIORITIES:
+            raise HTTPError(400, f"'priority' must be one of {', '.join(PRIORITIES)}")
+        self._prune()
+        deadline = deadline if deadline is not None else self.default_deadline
+        if deadline is not None:
+            deadline = min(deadline, self.max_deadline)
+        job_id = uuid.uuid4().hex if self.process_ports is None else f"{self.process}-{uuid.uuid4().hex}"
+        job = Job(id=job_id, question=question, clarification=clarification, tenant=tenant, priority=priority,
+                  deadline=time.time() + deadline if deadline is not None else None)
+        self._enqueue(job)
+        self.jobs[job.id] = job
+        metrics.incr("service.accepted")
+        return job
+
+    def clarify(self, job: Job, answer: str):
+        """Queue the continuation of a job that is waiting for clarification."""
+        if job.status != "needs_clarification":
+            raise HTTPError(409, f"job is {job.status}, not waiting for clarification")
+        job.clarification, job.resume = answer, True
+        self._enqueue(job)
+        job.finished_at = None  # running again: not prunable until it finishes
+
+    def _enqueue(self, job: Job):
+        if self.draining:
+            raise HTTPError(503, "service is shutting down", {"Retry-After": str(self.retry_after())})
+        try:
+            self.scheduler.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.incr("service.rejected")
+            retry_after = self.retry_after()
+            raise HTTPError(429, f"queue full, retry in {retry_after}s", {"Retry-After": str(retry_after)})
+        job.queued_at = time.time()
+        self._emit(job, {"event": "status", "status": "queued", "queued_jobs": self.scheduler.qsize()})
+
+    def retry_after(self) -> int:
+        """Seconds until the queue has room again, from the queue depth and the observed run time."""
+        run_seconds = metrics.mean("service.run_seconds") or DEFAULT_RUN_SECONDS
+        return max(1, math.ceil(self.scheduler.qsize() * run_seconds / self.workers))
+
+    def _prune(self):
+        now = time.time()
+        for job in list(self.jobs.values()):
+            if job.status == "needs_clarification" and job.finished_at < now - CLARIFICATION_RETENTION:
+                self._finish(job, "expired", error="no clarification arrived in time")
+            elif job.status in TERMINAL_STATUSES and job.finished_at < now - JOB_RETENTION:
+                del self.jobs[job.id]
+
+    def _emit(self, job: Job, event: Dict[str, Any]):
+        """Record an event and wake the job's streams (event loop thread only)."""
+        if event.get("event") == "status":
+            job.status = event["status"]
+        job.events.append(event)
+        changed, job.changed = job.changed, asyncio.Event()
+        changed.set()
+
+    def _emit_threadsafe(self, job: Job, event: Dict[str, Any]):
+        self._loop.call_soon_threadsafe(self._emit, job, event)
+
+    def _finish(self, job: Job, status: str, **fields):
+        for name, value in fields.items():
+            setattr(job, name, value)
+        job.finished_at = time.time()
+        self._emit(job, {"event": "status", "status": status, **fields})
+
+    async def _worker(self):
+        while True:
+            job = await self.scheduler.get()
+            try:
+                if job.deadline is not None and time.time() >= job.deadline:
+                    metrics.incr("service.expired")
+                    self._finish(job, "expired", error="the deadline passed while the job was queued")
+                    continue
+                metrics.observe("service.queue_seconds", time.time() - job.queued_at)
+                metrics.observe(f"service.{job.priority}.queue_seconds", time.time() - job.queued_at)
+                self.running += 1
+                self._emit(job, {"event": "status", "status": "running"})
+                started = time.perf_counter()
+                try:
+                    result = await self._loop.run_in_executor(self._executor, self._run, job)
+                except Exception as e:
+                    self._finish(job, "failed", error=f"{type(e).__name__}: {e}")
+                else:
+                    metrics.observe("service.run_seconds", time.perf_counter() - started)
+                    if result.status == "needs_clarification":
+                        self._finish(job, "needs_clarification", clarification_question=result.clarification_question)
+                    else:
+                        self._finish(job, "done", output=result.output)
+                finally:
+                    self.running -= 1
+            finally:
+                self.scheduler.done(job)
+
+    def _run(self, job: Job):
+        """Run or continue the job's graph run (worker thread), with its priority for the LLM and tool limits."""
+        def on_step(node: str):
+            self._emit_threadsafe(job, {"event": "step", "node": node})
+
+        with run_priority(job.priority):
+            if job.resume:
+                return self.agent.resume(job.id, job.clarification, on_step=on_step)
+            time_budget = None if job.deadline is None else job.deadline - time.time()
+            return self.agent.start(job.question, clarification_answer=job.clarification, time_budget=time_budget,
+                                    run_id=job.id, on_step=on_step)
+
+    # HTTP
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, headers, body = await asyncio.wait_for(self._read_request(reader), REQUEST_READ_TIMEOUT)
+                await self._route(method, path, headers, body, writer)
+            except HTTPError as e:
+                await self._send_json(writer, e.status, {"error": str(e)}, e.headers)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                await self._send_json(writer, 400, {"error": "malformed request"})
+        except ConnectionError:
+            pass  # the client went away
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), urlsplit(target).path.rstrip("/"), headers, body
+
+    async def _route(self, method: str, path: str, headers: Dict[str, str], body: bytes, writer: asyncio.StreamWriter):
+        parts = path.strip("/").split("/")
+        if method == "GET" and parts == ["health"]:
+            return await self._send_json(writer, 200, self.health())
+        if parts[0] != "research" or len(parts) > 3:
+            raise HTTPError(404, "not found")
+        if len(parts) == 1:
+            if method != "POST":
+                raise HTTPError(405, "use POST to submit a question")
+            request = self._parse_json(body)
+            question = (request.get("question") or "").strip()
+            if not question:
+                raise HTTPError(400, "'question' is required")
+            deadline = request.get("deadline")
+            if deadline is not None and (not isinstance(deadline, (int, float)) or deadline <= 0):
+                raise HTTPError(400, "'deadline' must be a positive number of seconds")
+            job = self.submit(question, request.get("clarification"), deadline,
+                              tenant=headers.get("x-tenant") or "anonymous", priority=request.get("priority") or "interactive")
+            return await self._send_json(writer, 202, {**job.to_dict(), "poll": f"/research/{job.id}",
+                                                       "stream": f"/research/{job.id}/stream"})
+        job = self.jobs.get(parts[1])
+        if job is None:
+            owner_port = self._owner_port(parts[1])
+            if owner_port is not None:
+                host = urlsplit("//" + headers.get("host", "")).hostname or "127.0.0.1"
+                host = f"[{host}]" if ":" in host else host
+                raise HTTPError(307, "job is served by another process", {"Location": f"http://{host}:{owner_port}{path}"})
+            raise HTTPError(404, "unknown job")
+        if len(parts) == 2 and method == "GET":
+            return await self._send_json(writer, 200, job.to_dict())
+        if parts[2:] == ["stream"] and method == "GET":
+            return await self._stream(job, writer)
+        if parts[2:] == ["clarification"] and method == "POST":
+            answer = (self._parse_json(body).get("answer") or "").strip()
+            if not answer:
+                raise HTTPError(400, "'answer' is required")
+            self.clarify(job, answer)
+            return await self._send_json(writer, 202, job.to_dict())
+        if parts[2:] not in ([], ["stream"], ["clarification"]):
+            raise HTTPError(404, "not found")
+        raise HTTPError(405, "method not allowed")
+
+    async def _stream(self, job: Job, writer: asyncio.StreamWriter):
+        """Server-sent events for the job: everything so far, then new events until the job is final."""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+        sent = 0
+        while True:
+            changed = job.changed
+            for event in job.events[sent:]:
+                writer.write(f"event: {event['event']}\ndata: {json.dumps(event)}\n\n".encode())
+            sent = len(job.events)
+            await writer.drain()
+            if job.status in FINAL_STATUSES:
+                return
+            await changed.wait()
+
+    @staticmethod
+    def _parse_json(body: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPError(400, "body must be JSON")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "body must be a JSON object")
+        return request
+
+    def _owner_port(self, job_id: str) -> Optional[int]:
+        """Own port of the pre-fork process serving `job_id`, if that is another process."""
+        process, _, _ = job_id.partition("-")
+        if self.process_ports is None or not process.isdigit() or int(process) == self.process:
+            return None
+        return self.process_ports[int(process)] if int(process) < len(self.process_ports) else None
+
+    @staticmethod
+    async def _send_json(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any],
+                         headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode()
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", "Content-Type: application/json",
+                f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    def health(self) -> Dict[str, Any]:
+        from llm import llm_slots
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "status": "draining" if self.draining else "ok",
+            "process": self.process if self.process_ports is not None else None,
+            "queued": self.scheduler.qsize(),
+            "queue_size": self.scheduler.maxsize,
+            "running": self.running,
+            "workers": self.workers,
+            "jobs": statuses,
+            "tenants": self.scheduler.tenant_report(),
+            "llm_calls": {"in_flight": llm_slots.in_use, "waiting": llm_slots.waiting, "limit": llm_slots.limit},
+            "tool_calls": {"in_flight": tool_slots.in_use, "waiting": tool_slots.waiting, "limit": tool_slots.limit},
+            "rate_limits": rate_limit_report(),
+            "circuits": circuit_report(),
+            "answer_cache": self.agent.answer_cache.stats() if self.agent.answer_cache is not None else None,
+            "mean_queue_seconds": {priority: metrics.mean(f"service.{priority}.queue_seconds") for priority in PRIORITIES},
+            "mean_run_seconds": metrics.mean("service.run_seconds"),
+        }
+
+
+async def serve(service: ResearchService, host: str, port: int, drain_timeout: float,
+                sock: Optional[socket.socket] = None):
+    """Serve until SIGINT/SIGTERM, then drain."""
+    await service.start(host, port, sock)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    print(f"Serving on http://{host}:{port} ({service.workers} workers, queue of {service.scheduler.maxsize})")
+    await stop.wait()
+    print("Shutting down: draining queued and running jobs")
+    await service.drain(drain_timeout)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the Deep Research Agent over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Research runs in parallel (per process)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Pre-forked service processes sharing --port after one warmup (prefork.py); "
+                             "process i also listens on --port + 1 + i")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Queued jobs before requests get 429")
+    parser.add_argument("--default-deadline", type=float, help="Deadline in seconds for requests that do not set one")
+    parser.add_argument("--max-deadline", type=float, default=MAX_DEADLINE, help="Upper bound for request deadlines")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="Seconds to finish jobs on shutdown")
+    parser.add_argument("--checkpoint", type=str, help='Checkpoint store: "memory", "sqlite:<path>" (default: sqlite:checkpoints.sqlite)')
+    parser.add_argument("--tenant-weight", action="append", default=[], metavar="TENANT=WEIGHT",
+                        help="Share of the workers for a tenant (X-Tenant header) relative to others (default 1)")
+    parser.add_argument("--tenant-cap", action="append", default=[], metavar="TENANT=N",
+                        help="Most concurrent runs for a tenant")
+    parser.add_argument("--default-tenant-cap", type=int, help="Most concurrent runs for tenants without --tenant-cap")
+    parser.add_argument("--llm-concurrency", type=int, help="Most BAML calls in flight across all runs")
+    parser.add_argument("--tool-concurrency", type=int, help="Most search and price calls in flight across all runs")
+    parser.add_argument("--search-backend", choices=sorted(search_backends.BACKENDS),
+                        help="Backend of the WebSearch tool (default: HEKMATICA_SEARCH_BACKEND or duckduckgo)")
+    parser.add_argument("--stub-backends", action="store_true",
+                        help="Answer with deterministic stub LLM, search and price backends (local testing)")
+    args = parser.parse_args()
+
+    if args.search_backend:
+        search_backends.set_default_backend(args.search_backend)
+    if args.tool_concurrency:
+        tool_slots.set_limit(args.tool_concurrency)
+
+    def run(process: int = 0, process_ports: Optional[List[int]] = None, sock: Optional[socket.socket] = None):
+        # The agent, and with it the BAML runtime, is loaded here: after forking in pre-fork mode
+        from agent import DeepResearchAgent, get_agent_graph
+        from llm import llm_slots
+        if args.stub_backends:
+            import agent as agent_module
+            from stubs import install_stub_backends
+            install_stub_backends(agent_module, llm_latency=0.2, search_latency=0.3)
+        if args.llm_concurrency:
+            llm_slots.set_limit(args.llm_concurrency)
+        research_agent = DeepResearchAgent(get_agent_graph(args.checkpoint))
+        port = args.port if process_ports is None else process_ports[process]
+        asyncio.run(serve(
+            ResearchService(research_agent, workers=args.workers, queue_size=args.queue_size,
+                            default_deadline=args.default_deadline, max_deadline=args.max_deadline,
+                            tenant_weights={name: float(value) for name, value in (w.split("=", 1) for w in args.tenant_weight)},
+                            tenant_caps={name: int(value) for name, value in (c.split("=", 1) for c in args.tenant_cap)},
+                            default_tenant_cap=args.default_tenant_cap, process=process, process_ports=process_ports),
+            args.host, port, args.drain_timeout, sock,
+        ))
+
+    if args.processes > 1:
+        from prefork import run_workers
+        # Bound once in the parent: every process accepts from it
+        shared = socket.create_server((args.host, args.port))
+        ports = [args.port + 1 + process for process in range(args.processes)]
+        sys.exit(1 if run_workers(args.processes, lambda process: run(process, ports, shared)) else 0)
+    run()
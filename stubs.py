@@ -0,0 +1,54 @@
+import time
+from typing import List
+
+from baml_client.types import Answer, Clarification, Critique, Plan, RankedResultItem, Source, Step, Tool
+
+from ranking import local_score, query_weights
+from results import ResultRecord
+
+
+def stub_llm(function: str, timeout: float = None, latency: float = 0.0, **kwargs):
+    """Deterministic stand-in for call_llm: plausible outputs for every BAML function, no API calls."""
+    if latency:
+        time.sleep(latency if timeout is None else min(latency, max(timeout, 0.0)))
+    if function == "ClarifyQuestion":
+        return Clarification(needed=False, question="")
+    if function == "GenerateSubqueries":
+        question = kwargs["question"].rstrip("?")
+        return [question, f"{question} background"]
+    if function == "PlanSteps":
+        return Plan(steps=[Step(tool=Tool.WebSearch, query=subquery) for subquery in kwargs["subqueries"]])
+    if function == "RankResults":
+        weights = query_weights(kwargs["question"], kwargs["subqueries"])
+        ranked = sorted(kwargs["results"], key=lambda item: -local_score(weights, item.content))
+        return [RankedResultItem(content=item.content, link=item.link, relevance_score=max(local_score(weights, item.content), 7))
+                for item in ranked[:kwargs["top_k"]]]
+    if function == "AnswerQuestion":
+        context = kwargs["context"][:2]
+        sentences = [f"{item.content} [{index}]." for index, item in enumerate(context)]
+        return Answer(cited_answer=" ".join(sentences) or "No information found.",
+                      references=[Source(index=index, source=item.source, source_type="WebSearch")
+                                  for index, item in enumerate(context) if item.source])
+    if function == "CritiqueAnswer":
+        return Critique(is_good=True, missing_info="")
+    raise ValueError(f"No stub for BAML function {function}")
+
+
+def stub_search(query: str, max_results: int = 5, timeout: float = None, latency: float = 0.0) -> List[ResultRecord]:
+    """Deterministic stand-in for web_search."""
+    if latency:
+        time.sleep(latency if timeout is None else min(latency, max(timeout, 0.0)))
+    slug = "-".join(query.lower().split())[:60]
+    return [ResultRecord(content=f"Result {i} about {query}", link=f"https://example.com/{slug}/{i}", query=query)
+            for i in range(max_results)]
+
+
+def install_stub_backends(agent_module, llm_latency: float = 0.0, search_latency: float = 0.0):
+    """Replace the LLM, search and price backends used by `agent_module` (the imported agent) with
+    the stubs above, for local runs and load tests without network access or API keys."""
+    agent_module.call_llm = lambda function, timeout=None, **kwargs: stub_llm(function, timeout, llm_latency, **kwargs)
+    agent_module.web_search = lambda query, max_results=5, timeout=None: stub_search(query, max_results, timeout, search_latency)
+    agent_module.multi_search = lambda queries, max_results=5, timeout=None: [
+        stub_search(query, max_results, timeout, search_latency) for query in queries
+    ]
+    agent_module.get_current_price = lambda coin_name, timeout=None: "$100.00"
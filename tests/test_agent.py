@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+import agent
+from agent import AgentState, DeepResearchAgent, RefinementPolicy, critique_node
+from baml_client.types import Answer
+
+
+def test_failed_critique_keeps_the_answer(monkeypatch):
+    calls = {}
+
+    def call_llm(function, timeout=None, **kwargs):
+        calls[function] = timeout
+        raise TimeoutError(f"{function} did not finish within {timeout:.1f}s")
+
+    monkeypatch.setattr(agent, "call_llm", call_llm)
+    answer = Answer(cited_answer="Rome fell.", references=[])
+    state = AgentState(question="Why did Rome fall?", answer=answer, deadline=time.time() + 60,
+                       refinement=RefinementPolicy(precheck=False))
+
+    update = critique_node(state)
+
+    assert update["critique"] is None and update["partial"]
+    assert update["degradations"] == ["CritiqueAnswer timed out, kept the answer"]
+    assert 0 < calls["CritiqueAnswer"] < 60
+    assert state.answer == answer
+
+
+def test_attempt_limit_comes_from_one_place():
+    assert DeepResearchAgent(None, max_attempt_count=3).refinement_policy.max_attempts == 3
+    policy = RefinementPolicy(max_attempts=4)
+    assert DeepResearchAgent(None, refinement_policy=policy).max_attempt_count == 4
+    assert DeepResearchAgent(None, max_attempt_count=4, refinement_policy=policy).max_attempt_count == 4
+    with pytest.raises(ValueError):
+        DeepResearchAgent(None, max_attempt_count=2, refinement_policy=policy)
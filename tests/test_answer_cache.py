@@ -0,0 +1,29 @@
+from answer_cache import AnswerCache
+
+
+def test_vectors_grow_with_the_entries():
+    cache = AnswerCache()
+    assert cache._vectors is None
+    for i in range(100):
+        cache.put(f"what happened in year {i}", None, f"answer {i}", ["WebSearch"])
+    assert len(cache._vectors) == 128
+    assert cache.get("What happened in year 99?").output == "answer 99"
+
+
+def test_oldest_entry_is_evicted_when_full():
+    cache = AnswerCache(max_entries=3)
+    for coin in ("bitcoin", "dogecoin", "ethereum", "solana"):
+        cache.put(f"{coin} price history", None, coin, ["WebSearch"])
+    assert len(cache._vectors) == 3
+    assert cache.get("bitcoin price history") is None
+    assert cache.get("solana price history").output == "solana"
+    assert cache.stats()["entries"] == 3
+
+
+def test_questions_differing_in_a_number_do_not_share_an_answer():
+    cache = AnswerCache()
+    cache.put("What were the causes of World War 1?", None, "world war 1", ["WebSearch"])
+    cache.put("why did empire 1 fall", None, "empire 1", ["WebSearch"])
+    assert cache.get("What were the causes of World War 2?") is None
+    assert cache.get("Why did empire 2 fall?") is None
+    assert cache.get("what were the causes of world war 1").output == "world war 1"
@@ -0,0 +1,21 @@
+from circuit import CircuitBreaker
+
+
+def test_unavailable_while_a_half_open_probe_is_in_flight(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("circuit.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker("api.example.com", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    assert not breaker.available()
+
+    now[0] += 30
+    assert breaker.available()
+    assert breaker.allow()  # the probe
+    assert not breaker.available()
+    assert not breaker.allow()
+
+    now[0] += 30  # the probe never reported: another one may go
+    assert breaker.available()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.available()
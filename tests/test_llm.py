@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+import llm
+
+
+class FakeClient:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def AnswerQuestion(self, **kwargs):
+        await asyncio.sleep(self.delay)
+        return "answer"
+
+
+class FailingClient:
+    async def AnswerQuestion(self, **kwargs):
+        raise RuntimeError("503 from provider")
+
+
+class SyncClient:
+    def __init__(self, client):
+        self.client = client
+
+    def AnswerQuestion(self, **kwargs):
+        return asyncio.run(self.client.AnswerQuestion(**kwargs))
+
+
+def use_clients(monkeypatch, clients):
+    router = llm.ClientRouter()
+    monkeypatch.setattr(router, "async_client", clients.get)
+    monkeypatch.setattr(router, "client", lambda name: SyncClient(clients[name]))
+    monkeypatch.setattr(router, "candidates", lambda function: list(clients))
+    monkeypatch.setattr(llm, "router", router)
+    monkeypatch.setattr(llm, "hedge_budget", llm.HedgeBudget())
+    return router
+
+
+def test_hedge_loser_is_not_recorded_as_success(monkeypatch):
+    router = use_clients(monkeypatch, {"Slow": FakeClient(1.0), "Fast": FakeClient(0.01)})
+    policy = llm.HedgePolicy(default_delay=0.05, min_delay=0.05)
+
+    tried = []
+    result = asyncio.run(llm._hedged_call("AnswerQuestion", "Slow", "Fast", policy, {}, tried))
+
+    assert result == "answer"
+    assert tried == ["Slow", "Fast"]
+    report = router.report()
+    assert report["AnswerQuestion"]["Fast"]["samples"] == 1
+    assert "Slow" not in report["AnswerQuestion"]
+
+
+@pytest.mark.parametrize("timeout", [None, 5.0])
+def test_failed_primary_fails_over_when_no_hedge_was_sent(monkeypatch, timeout):
+    use_clients(monkeypatch, {"A": FailingClient(), "B": FakeClient(0.01)})
+    monkeypatch.setitem(llm.HEDGE_POLICIES, "AnswerQuestion", llm.HedgePolicy(default_delay=1.0))
+
+    assert llm._call_llm("AnswerQuestion", timeout) == "answer"
@@ -0,0 +1,99 @@
+import multiprocessing
+import time
+
+import numpy as np
+
+import memory as memory_module
+from memory import ResearchMemory
+from results import ResultRecord
+
+
+def remember(memory: ResearchMemory, coin: str, count: int = 4):
+    memory.add([ResultRecord(content=f"{coin} price history", link=f"https://example.com/{coin}/{i}",
+                             query=f"{coin} price history", tool="WebSearch") for i in range(count)])
+
+
+def test_recall_does_not_answer_for_another_coin(tmp_path):
+    memory = ResearchMemory(str(tmp_path))
+    remember(memory, "bitcoin")
+    assert memory.recall("dogecoin price history", "WebSearch") == []
+    assert memory.recall("ethereum price history", "WebSearch") == []
+
+
+def test_recall_returns_the_same_topic(tmp_path):
+    memory = ResearchMemory(str(tmp_path))
+    remember(memory, "bitcoin")
+    remember(memory, "dogecoin")
+    recalled = memory.recall("bitcoin price history", "WebSearch")
+    assert len(recalled) == 4
+    assert all("/bitcoin/" in result.link for result in recalled)
+    assert all(result.query == "bitcoin price history" for result in recalled)
+
+
+def test_recall_skips_stale_results(tmp_path):
+    memory = ResearchMemory(str(tmp_path))
+    memory.add([ResultRecord(content="Current bitcoin price: $100", link="https://example.com/bitcoin",
+                             query="bitcoin", tool="PriceLookup", fetched_at=time.time() - 3600)])
+    assert memory.recall("bitcoin", "PriceLookup") == []
+
+
+def test_recall_does_not_answer_for_another_number(tmp_path):
+    memory = ResearchMemory(str(tmp_path))
+    memory.add([ResultRecord(content="The causes of World War 1", link=f"https://example.com/ww1/{i}",
+                             query="causes of world war 1", tool="WebSearch") for i in range(4)])
+    assert memory.recall("causes of world war 2", "WebSearch") == []
+    assert len(memory.recall("causes of world war 1", "WebSearch")) == 4
+
+
+def stored_lines(path) -> int:
+    with open(path / "records.jsonl", encoding="utf-8") as f:
+        return sum(1 for _ in f)
+
+
+def test_load_drops_superseded_and_expired_rows(tmp_path):
+    memory = ResearchMemory(str(tmp_path))
+    now = time.time()
+    for age in (30, 20, 10):
+        memory.add([ResultRecord(content=f"Current bitcoin price: ${age}", link="https://example.com/bitcoin",
+                                 query="bitcoin", tool="PriceLookup", fetched_at=now - age)])
+    memory.add([ResultRecord(content="Old news", link="https://example.com/old", query="old news",
+                             tool="WebSearch", fetched_at=now - 30 * 24 * 3600)])
+    assert stored_lines(tmp_path) == 4
+
+    reloaded = ResearchMemory(str(tmp_path))
+    assert stored_lines(tmp_path) == 1
+    assert len(reloaded) == 1
+    assert reloaded.recall("bitcoin", "PriceLookup")[0].content == "Current bitcoin price: $10"
+
+
+def add_many(path: str, worker: int):
+    memory = ResearchMemory(path)
+    for i in range(40):
+        memory.add([ResultRecord(content=f"result {worker} {i} " + "text " * i, link=f"https://example.com/{worker}/{i}",
+                                 query=f"query {worker} {i}", tool="WebSearch")])
+
+
+def test_concurrent_writers_keep_records_and_vectors_aligned(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=add_many, args=(str(tmp_path), worker)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+    memory = ResearchMemory(str(tmp_path))
+    assert len(memory) == 160
+    for row, record in enumerate(memory._records):
+        assert np.allclose(memory._vectors[row], memory.embedder.embed(memory._text(record)))
+
+
+def test_repeat_lookups_are_compacted_while_running(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_module, "MIN_COMPACT_ROWS", 4)
+    memory = ResearchMemory(str(tmp_path))
+    now = time.time()
+    for i in range(20):
+        memory.add([ResultRecord(content=f"Current bitcoin price: ${i}", link="https://example.com/bitcoin",
+                                 query="bitcoin", tool="PriceLookup", fetched_at=now - 20 + i)])
+    assert stored_lines(tmp_path) <= 5
+    assert memory._size <= 5
+    assert memory.recall("bitcoin", "PriceLookup")[0].content == "Current bitcoin price: $19"
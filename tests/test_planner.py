@@ -0,0 +1,34 @@
+import pytest
+from baml_client.types import Tool
+
+from planner import PLANNER_CONFIDENCE_THRESHOLD, local_plan
+
+
+@pytest.mark.parametrize("subquery, coin_id", [
+    ("bitcoin price", "bitcoin"),
+    ("current ETH price in USD", "ethereum"),
+    ("what is the price of one bitcoin right now", "bitcoin"),
+])
+def test_pure_price_subquery_is_a_confident_lookup(subquery, coin_id):
+    plan, confidence = local_plan([subquery])
+    assert [(step.tool, step.query) for step in plan.steps] == [(Tool.PriceLookup, coin_id)]
+    assert confidence >= PLANNER_CONFIDENCE_THRESHOLD
+
+
+@pytest.mark.parametrize("subquery", [
+    "ethereum value proposition",
+    "solana transaction cost",
+    "bitcoin adoption rate",
+    "ethereum gas fees cost",
+    "is bitcoin worth investing in",
+])
+def test_broad_price_words_keep_web_research(subquery):
+    plan, confidence = local_plan([subquery])
+    assert any(step.tool == Tool.WebSearch for step in plan.steps)
+    assert confidence < PLANNER_CONFIDENCE_THRESHOLD
+
+
+def test_price_history_is_web_research():
+    plan, confidence = local_plan(["bitcoin price history"])
+    assert [step.tool for step in plan.steps] == [Tool.WebSearch]
+    assert confidence >= PLANNER_CONFIDENCE_THRESHOLD
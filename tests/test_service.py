@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import service
+from service import ResearchService
+
+
+def waiting_job(research: ResearchService, age: float):
+    job = research.submit("Why did Rome fall?")
+    research.scheduler.clear()
+    research._finish(job, "needs_clarification", clarification_question="Which Rome?")
+    job.finished_at = time.time() - age
+    return job
+
+
+def test_prune_keeps_jobs_waiting_for_clarification():
+    async def scenario():
+        research = ResearchService(agent=None)
+        job = waiting_job(research, service.JOB_RETENTION + 1)
+        research._prune()
+        assert research.jobs[job.id].status == "needs_clarification"
+
+        research.clarify(job, "The Western Roman Empire")
+        assert job.status == "queued" and job.finished_at is None
+        research._prune()
+        assert job.id in research.jobs
+
+    asyncio.run(scenario())
+
+
+def test_prune_expires_abandoned_clarifications_and_drops_old_jobs():
+    async def scenario():
+        research = ResearchService(agent=None)
+        job = waiting_job(research, service.CLARIFICATION_RETENTION + 1)
+        research._prune()
+        assert job.status == "expired"
+
+        job.finished_at = time.time() - service.JOB_RETENTION - 1
+        research._prune()
+        assert job.id not in research.jobs
+
+    asyncio.run(scenario())
+
+
+def test_prefork_jobs_are_found_through_their_process():
+    async def scenario():
+        research = ResearchService(agent=None, process=0, process_ports=[9001, 9002])
+        job = research.submit("Why did Rome fall?")
+        assert job.id.startswith("0-")
+        assert research._owner_port(job.id) is None
+        assert research._owner_port("1-" + "0" * 32) == 9002
+        assert research._owner_port("7-" + "0" * 32) is None
+        assert ResearchService(agent=None)._owner_port("1-" + "0" * 32) is None
+
+    asyncio.run(scenario())
@@ -1,8 +1,18 @@
-import html
 import logging
-import requests
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-from langchain_community.tools import DuckDuckGoSearchRun, DuckDuckGoSearchResults
+from circuit import circuit_breaker
+from docindex import doc_index
+from ratelimit import is_rate_limited, rate_limiter
+from results import ResultRecord
+from search_backends import search_backend
+from scheduler import PrioritySemaphore, submit_in_context
 
 # Fallback: optionally, implement a simple HTML query to DuckDuckGo if library not installed (not shown for brevity)
 
@@ -12,6 +22,93 @@ logger = logging.getLogger("SearchTool")
 
 logger = logging.getLogger("PriceTool")
 
+# Default per-call timeouts in seconds (callers with a deadline pass smaller ones)
+SEARCH_TIMEOUT = 10.0
+PRICE_TIMEOUT = 5.0
+
+# How long tool results are reused (seconds). Prices move, search results much less so.
+SEARCH_CACHE_TTL = 15 * 60
+PRICE_CACHE_TTL = 30
+
+class TTLCache:
+    """Small thread-safe cache whose entries expire after `ttl` seconds. Shared by every run in the process."""
+
+    def __init__(self, ttl: float, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Drop the entry closest to expiry to make room
+                del self._entries[min(self._entries, key=lambda k: self._entries[k][0])]
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+search_cache = TTLCache(SEARCH_CACHE_TTL)
+price_cache = TTLCache(PRICE_CACHE_TTL)
+
+# Most search and price requests in flight at once across all runs in the process; waiting calls go by run priority
+tool_slots = PrioritySemaphore(int(os.environ.get("HEKMATICA_TOOL_CONCURRENCY", "8")))
+
+# Upstream endpoint behind each tool; each endpoint has a circuit breaker that fails calls fast while it is down.
+# WebSearch goes to the endpoint of the current search backend (see tool_endpoint()).
+TOOL_ENDPOINTS = {
+    "PriceLookup": "coingecko.price",
+}
+
+def tool_endpoint(tool: str):
+    """The endpoint (circuit breaker name) behind a tool, or None if it makes no network calls."""
+    if tool == "WebSearch":
+        upstream = search_backend().upstream
+        return upstream and f"{upstream}.search"
+    return TOOL_ENDPOINTS.get(tool)
+
+def tool_available(tool: str) -> bool:
+    """Whether the tool's endpoint is expected to answer (its circuit is not open, or for LocalDocs, the index is not empty)."""
+    if tool == "LocalDocs":
+        return doc_index().passages > 0
+    endpoint = tool_endpoint(tool)
+    return endpoint is None or circuit_breaker(endpoint).available()
+
+# Remote search backends have no timeout option, so searches run on this pool and are abandoned when late
+_search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="web-search")
+
+# HTTP session, created on first use (importing requests is slow) and then shared by every call in the process
+_clients_lock = threading.Lock()
+_http_session = None
+
+def search_tool():
+    """The shared DuckDuckGo search tool (list output)."""
+    return search_backend("duckduckgo").tool()
+
+def http_session():
+    """The shared requests session, so price lookups reuse their connection to the API."""
+    global _http_session
+    with _clients_lock:
+        if _http_session is None:
+            import requests
+            _http_session = requests.Session()
+        return _http_session
+
 # Common mappings for coin names to CoinGecko IDs
 COIN_ID_MAP = {
     "bitcoin": "bitcoin",
@@ -27,63 +124,169 @@ COIN_ID_MAP = {
     # Add more mappings as needed
 }
 
-def web_search(query: str, max_results: int = 5):
-    """Search the web for the query and return a list of dictionaries, each with 'content' and 'link'."""
-    results = [] # Now stores list of dicts
-    try:
-        # Use DuckDuckGoSearchResults with list output format
-        search_list_tool = DuckDuckGoSearchResults(output_format="list")
-        raw_results = search_list_tool.invoke(query) 
-        
-        # Limit results manually
-        raw_results = raw_results[:max_results]
+def find_coin_ids(text: str):
+    """Return the distinct CoinGecko IDs of all known coins mentioned in the text, in order of appearance."""
+    coin_ids = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        coin_id = COIN_ID_MAP.get(word)
+        if coin_id and coin_id not in coin_ids:
+            coin_ids.append(coin_id)
+    return coin_ids
 
-    except Exception as e:
-        logger.error(f"Search query failed: {e}")
-        return results # Return empty list on failure
-
-    if not raw_results:
-        return results # Return empty list if no results
-
-    for item in raw_results:
-        # Ensure item is a dictionary before proceeding
-        if not isinstance(item, dict):
-            logger.warning(f"Skipping unexpected search result format: {item}")
-            continue
-            
-        title = item.get("title", "")
-        snippet = item.get("snippet", "")
-        link = item.get("link", "") # Get the link
-
-        title = html.unescape(title)
-        snippet = html.unescape(snippet)
-        
-        content = title + ": " + snippet if snippet else title
-        content = content.strip()
-        
-        if content and link: # Only add if both content and link are present
-            results.append({'content': content, 'link': link})
-            
+# Query parameters that only track the click and do not change the page
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "ref", "ref_src", "mc_cid", "mc_eid"}
+
+def canonical_link(link):
+    """Normalize a URL so that the same page found by different searches compares equal."""
+    if not link:
+        return link
+    parts = urlsplit(link.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    ))
+    scheme = "https" if parts.scheme.lower() in ("http", "https") else parts.scheme.lower()
+    return urlunsplit((scheme, host, parts.path.rstrip("/"), query, ""))
+
+def _remaining(started: float, timeout: float):
+    """Seconds left of `timeout` since `started` (None means no timeout)."""
+    return None if timeout is None else max(timeout - (time.monotonic() - started), 0.0)
+
+def coin_page_url(coin_id: str):
+    """Public CoinGecko page for a coin, used as the citable source of a price lookup."""
+    return f"https://www.coingecko.com/en/coins/{coin_id}"
+
+def web_search(query: str, max_results: int = 5, timeout: float = SEARCH_TIMEOUT) -> List[ResultRecord]:
+    """Search the web (the current search backend) for the query and return a list of ResultRecords tagged with the query."""
+    backend = search_backend()
+    cache_key = (backend.name, " ".join(query.lower().split()), max_results)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        # Records are never modified, so cached ones can be handed out as they are
+        return list(cached)
+
+    if backend.upstream is None:
+        # Local backends answer in-process: no rate limit, slot or timeout needed
+        raw_results = backend.search(query, max_results)
+    else:
+        raw_results = _remote_search(backend, query, max_results, timeout)
+
+    results = [
+        ResultRecord(content=item["content"], link=item["link"], query=query, tool="WebSearch")
+        for item in raw_results if item.get("content") and item.get("link")
+    ]
+    if results:
+        search_cache.set(cache_key, list(results))
     return results
 
 
-def get_current_price(coin_name: str):
+def _remote_search(backend, query: str, max_results: int, timeout: float):
+    """backend.search() behind the upstream's circuit breaker, rate limiter and the tool slots, within `timeout`.
+
+    Returns [] on failure."""
+    breaker = circuit_breaker(f"{backend.upstream}.search")
+    if not breaker.allow():
+        logger.warning(f"{backend.name} circuit is open, skipping search: {query}")
+        return []
+    started = time.monotonic()
+    limiter = rate_limiter(backend.upstream)
+    # Stay under the upstream's rate limit instead of running into it and getting nothing back
+    if not limiter.acquire(timeout):
+        logger.error(f"Search rate limit leaves no time for the query within {timeout:.1f}s: {query}")
+        return []
+    if not tool_slots.acquire(_remaining(started, timeout)):
+        logger.error(f"No search slot became free within {timeout:.1f}s: {query}")
+        return []
+    try:
+        raw_results = _search_executor.submit(backend.search, query, max_results).result(timeout=_remaining(started, timeout))
+        limiter.succeeded()
+        breaker.record_success()
+        return raw_results
+    except FutureTimeoutError:
+        breaker.record_failure()
+        logger.error(f"Search query timed out after {timeout:.1f}s: {query}")
+    except Exception as e:
+        if is_rate_limited(e):
+            # The upstream is up, just busy: slow down rather than trip the circuit
+            limiter.throttled()
+            logger.warning(f"Search rate-limited by {backend.name}, slowing down to {limiter.rate:.2f}/s: {query}")
+        else:
+            breaker.record_failure()
+            logger.error(f"Search query failed: {e}")
+    finally:
+        tool_slots.release()
+    return [] # Return empty list on failure
+
+
+def multi_search(queries, max_results: int = 5, timeout: float = SEARCH_TIMEOUT):
+    """Run web_search for several queries concurrently. Returns one result list per query, in order."""
+    if not queries:
+        return []
+    with ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix="multi-search") as executor:
+        futures = [submit_in_context(executor, web_search, query, max_results, timeout) for query in queries]
+        return [future.result() for future in futures]
+
+
+def local_docs(query: str, max_results: int = 5) -> List[ResultRecord]:
+    """Search our own documents (the LocalDocs index, see docindex.py) and return the best passages,
+    cited by file path and line, as ResultRecords tagged with the query."""
+    return [
+        ResultRecord(content=hit["content"], link=hit["link"], query=query, tool="LocalDocs")
+        for hit in doc_index().search(query, max_results)
+    ]
+
+
+def get_current_price(coin_name: str, timeout: float = PRICE_TIMEOUT):
     """Fetch the current price (USD) of the given cryptocurrency. Returns a string like '$12345.67' or None if not found."""
     coin_key = coin_name.strip().lower()
     # Use mapping to find CoinGecko ID
     coin_id = COIN_ID_MAP.get(coin_key, coin_key)
+    cached = price_cache.get(coin_id)
+    if cached is not None:
+        return cached
     url = f"https://api.coingecko.com/api/v3/simple/price?ids={coin_id}&vs_currencies=usd"
+    breaker = circuit_breaker(TOOL_ENDPOINTS["PriceLookup"])
+    if not breaker.allow():
+        logger.warning(f"CoinGecko circuit is open, skipping price lookup: {coin_name}")
+        return None
+    started = time.monotonic()
+    limiter = rate_limiter("coingecko")
+    if not limiter.acquire(timeout):
+        logger.error(f"Price API rate limit leaves no time for the lookup within {timeout:.1f}s: {coin_name}")
+        return None
+    if not tool_slots.acquire(_remaining(started, timeout)):
+        logger.error(f"No price lookup slot became free within {timeout:.1f}s: {coin_name}")
+        return None
     try:
-        resp = requests.get(url, timeout=5)
+        resp = http_session().get(url, timeout=None if timeout is None else max(_remaining(started, timeout), 0.1))
+        if resp.status_code == 429:
+            retry_after = resp.headers.get("Retry-After", "")
+            limiter.throttled(float(retry_after) if retry_after.isdigit() else None)
+            logger.warning(f"Price API rate-limited, slowing down to {limiter.rate:.2f}/s: {coin_name}")
+            return None
+        if resp.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
         resp.raise_for_status()
+        limiter.succeeded()
     except Exception as e:
+        if getattr(e, "response", None) is None:
+            # Connection errors and timeouts: the API did not answer at all
+            breaker.record_failure()
         logger.error(f"Price API request failed for {coin_name}: {e}")
         return None
+    finally:
+        tool_slots.release()
     data = resp.json()
     if coin_id in data and "usd" in data[coin_id]:
         price = data[coin_id]["usd"]
         # Format the price with comma and two decimals
         price_str = f"${price:,.2f}"
+        price_cache.set(coin_id, price_str)
         return price_str
     else:
         logger.info(f"Price for {coin_name} not found in API response.")